@@ -23,7 +23,7 @@ from flask_restful_swagger import swagger
 from flask_restful import Api
 from ..config import UPLOAD_PATH
 from .resources import (CreateTask, UploadTask, PrepareTask, ModelTask, ResultsTask, AvailableAdditives, LogIn,
-                        AvailableModels, RegisterModels, MagicNumbers)
+                        AvailableModels, RegisterModels, MagicNumbers, WaitTask, CancelTask, Metrics)
 
 api_bp = Blueprint('api', __name__)
 api = swagger.docs(Api(api_bp), apiVersion='1.0', description='MWUI API', api_spec_url='/doc/spec')
@@ -34,10 +34,13 @@ api.add_resource(UploadTask, '/task/upload/<int:_type>')
 api.add_resource(PrepareTask, '/task/prepare/<string:task>')
 api.add_resource(ModelTask, '/task/model/<string:task>')
 api.add_resource(ResultsTask, '/task/results/<string:task>')
+api.add_resource(WaitTask, '/task/wait/<string:task>')
+api.add_resource(CancelTask, '/task/cancel/<string:task>')
 api.add_resource(AvailableAdditives, '/resources/additives')
 api.add_resource(AvailableModels, '/resources/models')
 api.add_resource(MagicNumbers, '/resources/magic')
 api.add_resource(RegisterModels, '/admin/models')
+api.add_resource(Metrics, '/admin/metrics')
 api.add_resource(LogIn, '/auth')
 
 
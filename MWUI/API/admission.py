@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+from math import ceil
+from time import time
+
+
+bucket_script = """
+local tokens = tonumber(redis.call('hget', KEYS[1], 'tokens'))
+local ts = tonumber(redis.call('hget', KEYS[1], 'ts'))
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+if tokens == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call('hmset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('expire', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class Admission(object):
+    """ limits of task creation per user.
+
+    token bucket in MWUI_BUCKET_<user> hash: rate tasks per minute with burst.
+    structures in flight in MWUI_INFLIGHT_<user> sorted set: task ids with count of unfinished structures as score.
+    expired tasks removed from set on check.
+    """
+    def __init__(self, connection, rate=30, burst=10, inflight=10000, retry=30, ttl=86400):
+        self.__connection = connection
+        self.__ttl = ttl
+        self.__rate = rate / 60
+        self.__burst = burst
+        self.__inflight = inflight
+        self.__retry = retry
+        self.__bucket = connection.register_script(bucket_script)
+
+    def admit(self, user, size):
+        """ take token for new task with given count of structures. return 0 or seconds before retry.
+        """
+        if self.__inflight:
+            key = self.__key(user)
+            tasks = self.__connection.zrange(key, 0, -1, withscores=True)
+            if tasks:
+                with self.__connection.pipeline(transaction=False) as pipe:
+                    for task, _ in tasks:
+                        pipe.exists(task)
+                    expired = {task for (task, _), exists in zip(tasks, pipe.execute()) if not exists}
+                if expired:
+                    self.__connection.zrem(key, *expired)
+                if sum(count for task, count in tasks if task not in expired) + size > self.__inflight:
+                    return self.__retry
+
+        if self.__rate:
+            wait = float(self.__bucket(keys=['MWUI_BUCKET_%s' % user], args=[self.__rate, self.__burst, time()]))
+            if wait:
+                return ceil(wait)
+        return 0
+
+    def track(self, pipe, user, task, pending):
+        """ update count of unfinished structures of task in pipeline.
+        """
+        if not self.__inflight:
+            return
+        if pending:
+            pipe.zadd(self.__key(user), {task: pending})
+            pipe.expire(self.__key(user), self.__ttl)
+        else:
+            pipe.zrem(self.__key(user), task)
+
+    @staticmethod
+    def __key(user):
+        return 'MWUI_INFLIGHT_%s' % user
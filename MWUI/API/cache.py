@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+import pickle
+from hashlib import sha1
+from time import time
+
+
+class ResultCache(object):
+    """ modeling results shared between tasks.
+
+    value stored in MWUI_CACHE_<model>_<signature> key with ttl. every read refreshes ttl.
+    MWUI_CACHE_<model> sorted set keeps last access time of signatures. least recently used results removed
+    if model has more than size cached results.
+    """
+    def __init__(self, connection, ttl=604800, size=100000, serializer=pickle):
+        self.__connection = connection
+        self.__serializer = serializer
+        self.__ttl = ttl
+        self.__size = size
+
+    @property
+    def enabled(self):
+        return bool(self.__size)
+
+    @staticmethod
+    def signature(structure, model):
+        """ signature of prepared structure with conditions for given model.
+
+        prepared structures are standardized by preparer model. same input gives same prepared data.
+        """
+        key = (structure['data'], sorted((a['additive'], a['amount']) for a in structure['additives']),
+               structure['temperature'], structure['pressure'], model)
+        return sha1(repr(key).encode()).hexdigest()
+
+    def get_many(self, keys):
+        """ keys is dict of any key: (model, signature). return dict of key: cached model results for hits.
+        """
+        if not self.__size or not keys:
+            return {}
+
+        keys = list(keys.items())
+        hits = {}
+        with self.__connection.pipeline(transaction=False) as pipe:
+            for _, (model, signature) in keys:
+                pipe.get(self.__key(model, signature))
+            for (k, (model, signature)), value in zip(keys, pipe.execute()):
+                if value is not None:
+                    hits[k] = self.__serializer.loads(value)
+                    pipe.expire(self.__key(model, signature), self.__ttl)
+                    pipe.zadd(self.__index(model), {signature: time()})
+            pipe.execute()
+        return hits
+
+    def set_many(self, values):
+        """ values is list of (model, signature, model results).
+        """
+        if not self.__size or not values:
+            return
+
+        models = set()
+        with self.__connection.pipeline(transaction=False) as pipe:
+            for model, signature, value in values:
+                models.add(model)
+                value = dict(model=value['model'], name=value['name'], type=value['type'], results=value['results'])
+                pipe.set(self.__key(model, signature), self.__serializer.dumps(value), ex=self.__ttl)
+                pipe.zadd(self.__index(model), {signature: time()})
+            for model in models:
+                pipe.zcard(self.__index(model))
+            sizes = pipe.execute()[-len(models):]
+
+        for model, size in zip(models, sizes):
+            if size > self.__size:
+                self.__evict(model, size - self.__size)
+
+    def invalidate(self, model):
+        """ drop all cached results of model.
+        """
+        self.__evict(model)
+
+    def __evict(self, model, count=None):
+        index = self.__index(model)
+        signatures = self.__connection.zrange(index, 0, -1 if count is None else count - 1)
+        with self.__connection.pipeline(transaction=False) as pipe:
+            for x in range(0, len(signatures), 1000):
+                chunk = signatures[x: x + 1000]
+                pipe.delete(*(self.__key(model, s.decode()) for s in chunk))
+                pipe.zrem(index, *chunk)
+            pipe.execute()
+
+    @staticmethod
+    def __key(model, signature):
+        return 'MWUI_CACHE_%s_%s' % (model, signature)
+
+    @staticmethod
+    def __index(model):
+        return 'MWUI_CACHE_%s' % model
@@ -18,9 +18,14 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA 02110-1301, USA.
 #
-from pony.orm import db_session, select
+import json
+from hashlib import sha1
+from redis import Redis
+from time import monotonic
+from pony.orm import db_session
+from ..config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_CONNECT_TIMEOUT, REDIS_SOCKET_TIMEOUT
+from ..health import health, unavailable
 from ..models import Additive, Model
-from ..config import BLOG_POSTS_PER_PAGE
 from ..constants import ModelType
 
 '''
@@ -30,48 +35,140 @@ conditions = Set('Conditions')
 '''
 
 
+class Catalog(object):
+    """ models with destinations and additives tables cached in worker process.
+
+    MWUI_CATALOG_VERSION counter in redis incremented on tables change. workers check counter not often than
+    interval seconds and reload tables on change. without redis tables kept loaded.
+    tag is digest of loaded version and tables. same in all workers.
+    """
+    def __init__(self, connection, server, interval=1):
+        self.__connection = connection
+        self.__server = server
+        self.__interval = interval
+        self.__checked_at = None
+        self.__version = None
+        self.__tables = None
+        self.__tag = None
+
+    def tables(self):
+        """ models and additives dicts by id.
+        """
+        now = monotonic()
+        tables = self.__tables  # can be dropped by invalidate in other thread
+        if tables is None or now - self.__checked_at >= self.__interval:
+            version = self.__get_version()
+            if tables is None or version != self.__version:
+                tables = self.__load()
+                self.__tag = sha1(repr((version, sorted(tables[0].items()),
+                                        sorted(tables[1].items()))).encode()).hexdigest()
+                self.__tables = tables
+                self.__version = version
+            self.__checked_at = now
+        return tables
+
+    def tag(self):
+        """ version tag of tables.
+        """
+        self.tables()
+        return self.__tag
+
+    def invalidate(self):
+        """ notify all workers about tables change.
+        """
+        self.__tables = None
+        if health.allow(self.__server):
+            try:
+                self.__connection.incr('MWUI_CATALOG_VERSION')
+            except unavailable:
+                health.failure(self.__server)
+            else:
+                health.success(self.__server)
+
+    def __get_version(self):
+        if not health.allow(self.__server):
+            return self.__version
+        try:
+            version = self.__connection.get('MWUI_CATALOG_VERSION')
+        except unavailable:
+            health.failure(self.__server)
+            return self.__version
+        health.success(self.__server)
+        return version
+
+    @staticmethod
+    def __load():
+        with db_session:
+            models = {m.id: dict(model=m.id, name=m.name, description=m.description, type=m.type, example=m.example,
+                                 destinations=[dict(host=x.host, port=x.port, password=x.password, name=x.name)
+                                               for x in m.destinations])
+                      for m in Model.select()}
+            additives = {a.id: dict(additive=a.id, name=a.name, structure=a.structure, type=a.type)
+                         for a in Additive.select()}
+        return models, additives
+
+
+connection = Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD,
+                   socket_connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_SOCKET_TIMEOUT)
+health.watch((REDIS_HOST, REDIS_PORT), connection)
+catalog = Catalog(connection, (REDIS_HOST, REDIS_PORT))
+
+
 def get_model(_type):
-    with db_session:
-        return next(dict(model=m.id, name=m.name, description=m.description, type=m.type,
-                         destinations=[dict(host=x.host, port=x.port, password=x.password, name=x.name)
-                                       for x in m.destinations])
-                    for m in select(m for m in Model if m.model_type == _type.value))
+    return next(dict(model=m['model'], name=m['name'], description=m['description'], type=m['type'],
+                     destinations=[x.copy() for x in m['destinations']])
+                for m in catalog.tables()[0].values() if m['type'] == _type)
 
 
 def get_additives():
-    with db_session:
-        return {a.id: dict(additive=a.id, name=a.name, structure=a.structure, type=a.type)
-                for a in Additive.select()}
+    return {k: v.copy() for k, v in catalog.tables()[1].items()}
 
 
 def get_models_list(skip_prep=True, skip_destinations=False, skip_example=True):
-    with db_session:
-        res = {}
-        for m in (select(m for m in Model if m.model_type in (ModelType.MOLECULE_MODELING.value,
-                                                              ModelType.REACTION_MODELING.value))
-                  if skip_prep else select(m for m in Model)):
-            res[m.id] = dict(model=m.id, name=m.name, description=m.description, type=m.type)
-            if not skip_destinations:
-                res[m.id]['destinations'] = [dict(host=x.host, port=x.port, password=x.password, name=x.name)
-                                             for x in m.destinations]
-            if not skip_example:
-                res[m.id]['example'] = m.example
-        return res
-
-
-def format_results(task, fetched_task, page=None):
+    res = {}
+    for k, m in catalog.tables()[0].items():
+        if skip_prep and m['type'] not in (ModelType.MOLECULE_MODELING, ModelType.REACTION_MODELING):
+            continue
+        res[k] = dict(model=m['model'], name=m['name'], description=m['description'], type=m['type'])
+        if not skip_destinations:
+            res[k]['destinations'] = [x.copy() for x in m['destinations']]
+        if not skip_example:
+            res[k]['example'] = m['example']
+    return res
+
+
+def format_structure(s):
+    return dict(status=s['status'].value, type=s['type'].value, structure=s['structure'],
+                data=s['data'], pressure=s['pressure'], temperature=s['temperature'],
+                additives=[dict(additive=a['additive'], name=a['name'], structure=a['structure'],
+                                type=a['type'].value, amount=a['amount']) for a in s['additives']],
+                models=[dict(type=m['type'].value, model=m['model'], name=m['name'],
+                             results=[dict(type=r['type'].value, key=r['key'], value=r['value'])
+                                      for r in m.get('results', [])]) for m in s['models']])
+
+
+def format_results(task, fetched_task):
     result, ended_at = fetched_task
+    progress = result['progress']
     out = dict(task=task, date=ended_at.strftime("%Y-%m-%d %H:%M:%S"), status=result['status'].value,
-               type=result['type'].value, user=result['user'], structures=[])
-
-    for s in result['structures'][(page - 1) * BLOG_POSTS_PER_PAGE: page * BLOG_POSTS_PER_PAGE] \
-            if page else result['structures']:
-        out['structures'].append(dict(status=s['status'].value, type=s['type'].value, structure=s['structure'],
-                                      data=s['data'], pressure=s['pressure'], temperature=s['temperature'],
-                                      additives=[dict(additive=a['additive'], name=a['name'], structure=a['structure'],
-                                                      type=a['type'].value, amount=a['amount'])
-                                                 for a in s['additives']],
-                                      models=[dict(type=m['type'].value, model=m['model'], name=m['name'],
-                                                   results=[dict(type=r['type'].value, key=r['key'], value=r['value'])
-                                                            for r in m.get('results', [])]) for m in s['models']]))
+               type=result['type'].value, user=result['user'], structures=[],
+               progress=dict(done=progress['done'], total=progress['total'], eta=progress['eta'],
+                             models=[dict(model=m, done=d, total=t) for m, (d, t) in progress['models'].items()]))
+
+    for s in result['structures']:
+        out['structures'].append(format_structure(s))
     return out
+
+
+def stream_results(task, fetched_task):
+    """ task as NDJSON lines: task data without structures, then structures one per line.
+    structures of fetched task is iterator.
+    """
+    result, ended_at = fetched_task
+    structures = result['structures']
+    result['structures'] = []
+    out = format_results(task, (result, ended_at))
+    out.pop('structures')
+    yield json.dumps(out) + '\n'
+    for s in structures:
+        yield json.dumps(format_structure(s)) + '\n'
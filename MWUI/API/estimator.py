@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+from math import ceil
+from time import monotonic
+
+
+runtime_script = """
+local x, smoothing = tonumber(ARGV[2]), tonumber(ARGV[3])
+local count, mean, dev = 0, x, x / 2
+local stored = redis.call('hget', KEYS[1], ARGV[1])
+if stored then
+    local c, m, d = string.match(stored, '(%S+) (%S+) (%S+)')
+    count, mean, dev = tonumber(c), tonumber(m), tonumber(d)
+    local err = x - mean
+    mean = mean + smoothing * err
+    dev = dev + smoothing * (math.abs(err) - dev)
+end
+redis.call('hset', KEYS[1], ARGV[1], string.format('%d %.17g %.17g', count + 1, mean, dev))
+"""
+
+
+class RuntimeEstimator(object):
+    """ per-model time of one structure processing learned from finished jobs.
+
+    rolling mean and mean deviation of seconds per structure stored in MWUI_RUNTIME hash as
+    '<count> <mean> <deviation>' field of model. estimates cached in process for ttl seconds.
+    models with less than samples observations have no estimate.
+    """
+    def __init__(self, connection, job_timeout=3600, min_timeout=60, margin=3, smoothing=.1, samples=5, ttl=60):
+        self.__connection = connection
+        self.__job_timeout = job_timeout
+        self.__min_timeout = min_timeout
+        self.__margin = margin
+        self.__smoothing = smoothing
+        self.__samples = samples
+        self.__ttl = ttl
+        self.__cache = {}  # model: (checked_at, estimate)
+        self.__update = connection.register_script(runtime_script)
+
+    def observe(self, model, size, duration):
+        """ update estimate of model by job of size structures processed in duration seconds.
+        """
+        if size:
+            self.__update(keys=['MWUI_RUNTIME'], args=[model, duration / size, self.__smoothing])
+            self.__cache.pop(model, None)
+
+    def estimates(self, models):
+        """ seconds per structure as (mean, deviation) of models. None for unknown models.
+        """
+        now = monotonic()
+        out = {}
+        expired = []
+        for m in models:
+            cached = self.__cache.get(m)
+            if cached is not None and now - cached[0] < self.__ttl:
+                out[m] = cached[1]
+            else:
+                expired.append(m)
+
+        if expired:
+            for m, stored in zip(expired, self.__connection.hmget('MWUI_RUNTIME', expired)):
+                estimate = None
+                if stored is not None:
+                    count, mean, dev = stored.split()
+                    if int(count) >= self.__samples:
+                        estimate = float(mean), float(dev)
+                out[m] = estimate
+                self.__cache[m] = (now, estimate)
+        return out
+
+    def timeout(self, estimate, size, attempt=0):
+        """ job timeout for size structures. doubled on each resend. not more than default job timeout.
+        """
+        if estimate is None:
+            return self.__job_timeout
+        mean, dev = estimate
+        timeout = max(self.__min_timeout, ceil(size * (mean + 4 * dev) * self.__margin))
+        return min(self.__job_timeout, timeout * 2 ** attempt)
+
+    @staticmethod
+    def eta(estimates, progress):
+        """ seconds to finish unfinished structures of models. models processed in parallel.
+        None if any unfinished model has no estimate.
+        """
+        eta = 0
+        for m, (done, total) in progress.items():
+            if done < total:
+                estimate = estimates.get(m)
+                if estimate is None:
+                    return None
+                eta = max(eta, (total - done) * estimate[0])
+        return ceil(eta)
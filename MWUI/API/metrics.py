@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+""" minimal prometheus metrics. values kept in worker process memory.
+"""
+from bisect import bisect_left
+from threading import Lock
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                             for k, v in labels)
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = Lock()
+        self._values = {}
+
+    def render(self):
+        out = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.type)]
+        with self._lock:
+            values = sorted((k, v[:] if isinstance(v, list) else v) for k, v in self._values.items())
+        for labels, value in values:
+            out.extend(self._samples(labels, value))
+        return out
+
+    def _samples(self, labels, value):
+        return ['%s%s %s' % (self.name, format_labels(labels), repr(float(value)))]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets):
+        super().__init__(name, documentation)
+        self.__buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.__buckets) + 1) + [0.]  # buckets, +Inf, sum
+            counts[bisect_left(self.__buckets, value)] += 1
+            counts[-1] += value
+
+    def _samples(self, labels, value):
+        out = []
+        total = 0
+        for le, count in zip(self.__buckets + ('+Inf',), value):
+            total += count
+            out.append('%s_bucket%s %d' % (self.name, format_labels(labels + (('le', le),)), total))
+        out.append('%s_count%s %d' % (self.name, format_labels(labels), total))
+        out.append('%s_sum%s %s' % (self.name, format_labels(labels), repr(value[-1])))
+        return out
+
+
+def render(metrics):
+    """ prometheus text exposition format of metrics list.
+    """
+    out = []
+    for m in metrics:
+        out.extend(m.render())
+    out.append('')
+    return '\n'.join(out)
@@ -18,52 +18,582 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA 02110-1301, USA.
 #
-import pickle
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from datetime import datetime
+from time import monotonic, perf_counter, time
 from uuid import uuid4
-from redis import Redis, ConnectionError
-from rq import Queue
-from ..constants import TaskStatus, StructureStatus, ModelType
+from redis import Redis, ConnectionPool, ResponseError
+from rq import Queue, Callback
+from rq.command import send_command
+from rq.job import Job, JobStatus
+from rq.results import Result
+from .admission import Admission
+from .cache import ResultCache
+from .estimator import RuntimeEstimator
+from .metrics import Counter, Gauge, Histogram, render
+from .scheduler import Scheduler, FairShare
+from .serialization import Serializer
+from .spill import SpillStore
+from ..health import HealthMonitor, unavailable
+from ..constants import TaskStatus, StructureStatus, ModelType, JobPriority
 
 
 class RedisCombiner(object):
-    def __init__(self, host='localhost', port=6379, password=None, result_ttl=86400, job_timeout=3600):
+    def __init__(self, host='localhost', port=6379, password=None, result_ttl=86400, job_timeout=3600,
+                 scheduler='least_loaded', chunk_size=0, events=False, cache_ttl=604800, cache_size=100000,
+                 retry_attempts=3, retry_delay=10, connect_timeout=2, socket_timeout=10, health=None,
+                 compress_threshold=1024, lanes=False, interactive_size=10, share_window=3600, share_limit=1000,
+                 rate=30, burst=10, inflight=10000, min_timeout=60, timeout_margin=3, spill_path=None,
+                 spill_threshold=1048576):
         self.__result_ttl = result_ttl
         self.__job_timeout = job_timeout
+        self.__retry_attempts = retry_attempts
+        self.__retry_delay = retry_delay
+        self.__chunk_size = chunk_size
+        self.__connect_timeout = connect_timeout
+        self.__socket_timeout = socket_timeout
+        self.__serializer = Serializer(compress_threshold)
+        # large tasks data kept in files. redis keeps references.
+        self.__spill = SpillStore(spill_path, spill_threshold if spill_path else 0, ttl=result_ttl)
+        # workers publish finished jobs to MWUI redis. redis_events module should be available on workers.
+        self.__callbacks = dict(on_success=Callback('redis_events.run'),
+                                on_failure=Callback('redis_events.run')) if events else {}
+        self.__scheduler = Scheduler(scheduler)
+        # workers of destination should listen <name>_admin, <name> and <name>_batch queues in this order.
+        self.__lanes = {JobPriority.INTERACTIVE: '%s', JobPriority.BATCH: '%s_batch',
+                        JobPriority.ADMIN: '%s_admin'} if lanes else dict.fromkeys(JobPriority, '%s')
+        self.__shared_queue = not lanes
+        self.__interactive_size = interactive_size
+        self.__share_limit = share_limit
 
-        self.__tasks = Redis(host=host, port=port, password=password)
+        # servers availability. shared with other MWUI modules which use same redis servers.
+        self.__health = health or HealthMonitor()
+        self.__server = (host, port)
+        self.__tasks = Redis(host=host, port=port, password=password, socket_connect_timeout=connect_timeout,
+                             socket_timeout=socket_timeout)
+        self.__health.watch(self.__server, self.__tasks)
+        self.__cache = ResultCache(self.__tasks, ttl=cache_ttl, size=cache_size, serializer=self.__serializer)
+        self.__share = FairShare(self.__tasks, window=share_window)
+        self.__admission = Admission(self.__tasks, rate=rate, burst=burst, inflight=inflight, ttl=result_ttl)
+        self.__runtime = RuntimeEstimator(self.__tasks, job_timeout=job_timeout, min_timeout=min_timeout,
+                                          margin=timeout_margin)
+        # (host, port, name): (destination, connection, {priority: queue}). alive during worker process life.
+        self.__destinations = {}
 
-    def __new_worker(self, destinations):
+        durations = (.1, .5, 1, 5, 10, 30, 60, 300, 900, 3600, 14400)
+        self.__enqueued = Counter('mwui_jobs_enqueued_total', 'Jobs sent to modeling servers')
+        self.__enqueue_errors = Counter('mwui_jobs_enqueue_errors_total', 'Jobs not sent to modeling servers')
+        self.__queue_depth = Gauge('mwui_queue_depth', 'Jobs waiting in queues of modeling servers')
+        self.__queue_wait = Histogram('mwui_job_queue_wait_seconds', 'Time from job enqueue to start', durations)
+        self.__run_time = Histogram('mwui_job_run_seconds', 'Time of job processing by worker', durations)
+        self.__polls = Counter('mwui_fetch_job_total', 'Task polls by result')
+        self.__rtt = Histogram('mwui_redis_roundtrip_seconds', 'Latency of redis requests',
+                               (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+
+    def __new_worker(self, destinations, priority=JobPriority.INTERACTIVE):
+        candidates = []
         for x in destinations:
-            return x, self.__get_queue(x)  # todo: check for free machines. len(q) - number of tasks
-        return None
+            q = self.__get_queue(x, priority)
+            if q is not None:  # skip unavailable machines
+                candidates.append((x, q))
+        return self.__scheduler.select(candidates)
 
-    def __get_queue(self, destination):
-        r = Redis(host=destination['host'], port=destination['port'], password=destination['password'])
-        try:
-            r.ping()
-            return Queue(connection=r, name=destination['name'], default_timeout=self.__job_timeout)
-        except ConnectionError:
+    def __get_queue(self, destination, priority=JobPriority.INTERACTIVE):
+        server = (destination['host'], destination['port'])
+        if not self.__health.allow(server):  # dead server. checked in background.
+            return None
+
+        key = (destination['host'], destination['port'], destination['name'])
+        cached = self.__destinations.get(key)
+        if cached is not None and cached[0] != destination:
+            self.__drop_queue(key)  # destination changed. e.g. new password.
+            cached = None
+
+        if cached is None:
+            r = Redis(connection_pool=ConnectionPool(host=destination['host'], port=destination['port'],
+                                                     password=destination['password'],
+                                                     socket_connect_timeout=self.__connect_timeout,
+                                                     socket_timeout=self.__socket_timeout))
+            self.__health.watch(server, r)
+            cached = self.__destinations[key] = (destination.copy(), r, {})
+
+        q = cached[2].get(priority)
+        if q is None:
+            q = cached[2][priority] = Queue(connection=cached[1], name=self.__lanes[priority] % destination['name'],
+                                            default_timeout=self.__job_timeout)
+        return q
+
+    def __drop_queue(self, key):
+        cached = self.__destinations.pop(key, None)
+        if cached is not None:
+            cached[1].connection_pool.disconnect()
+
+    @staticmethod
+    def __name(destination, queue=None):
+        return '%s:%s/%s' % (destination['host'], destination['port'], queue.name if queue else destination['name'])
+
+    def __priority(self, task, size, priority):
+        """ choose priority lane of task and position in queue.
+
+        small tasks go to interactive lane. users which sent too many structures in share window go to batch lane.
+        without lanes interactive jobs placed at front of shared queue. dedicated lanes keep order of jobs.
+        """
+        if priority is None:
+            priority = JobPriority.INTERACTIVE if size <= self.__interactive_size else JobPriority.BATCH
+
+        usage, _ = self.__share.charge(task['user'], size)
+        if priority == JobPriority.INTERACTIVE and self.__share_limit and usage > self.__share_limit:
+            priority = JobPriority.BATCH
+        return priority, priority == JobPriority.INTERACTIVE and self.__shared_queue
+
+    def __fail(self, destination):
+        """ drop dead cached connection and count failure of server.
+        """
+        self.__drop_queue((destination['host'], destination['port'], destination['name']))
+        self.__health.failure((destination['host'], destination['port']))
+
+    def __split(self, structures):
+        if not self.__chunk_size:
+            return [structures]
+        return [structures[x: x + self.__chunk_size] for x in range(0, len(structures), self.__chunk_size)]
+
+    @staticmethod
+    def __group_jobs(jobs):
+        groups = OrderedDict()
+        for dest, sub_task in jobs:
+            groups.setdefault((dest['host'], dest['port'], dest['name']), (dest, []))[1].append(sub_task)
+        return groups.values()
+
+    @staticmethod
+    def __fetch_jobs(queue, sub_tasks):
+        """ load jobs of one destination and results of finished jobs in two pipelined round trips.
+        results of workers with rq older than 1.12 kept in job hash.
+        """
+        jobs = Job.fetch_many(sub_tasks, connection=queue.connection, serializer=queue.serializer)
+        finished = [j for j in jobs if j is not None and j.get_status(refresh=False) == JobStatus.FINISHED]
+        results = {}
+        if finished:
+            with queue.connection.pipeline() as pipe:
+                for j in finished:
+                    pipe.xrevrange(Result.get_key(j.id), '+', '-', count=1)
+                for j, r in zip(finished, pipe.execute()):
+                    if r:
+                        result_id, payload = r[0]
+                        results[j.id] = Result.restore(j.id, result_id.decode(), payload, connection=queue.connection,
+                                                       serializer=j.serializer).return_value
+        return [(j, j and results.get(j.id, j._result)) for j in jobs]
+
+    @staticmethod
+    def __delete_jobs(jobs):
+        groups = OrderedDict()
+        for queue, j, _ in jobs:
+            groups.setdefault(id(queue), (queue, []))[1].append(j)
+
+        for queue, group in groups.values():
+            try:
+                with queue.connection.pipeline() as pipe:
+                    for j in group:
+                        j.delete(pipeline=pipe)
+                    pipe.execute()
+            except unavailable:  # results already saved. jobs expire in result_ttl.
+                pass
+
+    def __merge(self, pipe, task, finished, unfinished, errors):
+        """ merge finished jobs into task stored in redis. called in WATCH transaction on task key.
+
+        parallel pollers can fetch the same finished jobs. only jobs still listed in task are merged.
+        on concurrent task change transaction retried with reloaded task.
+        only changed structures rewritten.
+
+        failed and lost jobs rescheduled with exponential backoff to other destination of model. new job ids
+        reserved in transaction, and enqueued by caller after commit.
+        structures of jobs failed too many times returned with empty results.
+        """
+        loaded = self.__load_task(pipe, task)
+        if loaded is None:
+            return None
+
+        result, ended_at, legacy = loaded
+        listed = {x for _, x in result['jobs']}
+        finished = [x for x in finished if x[1].id in listed]
+        now = time()
+
+        retry = []
+        rejected = []
+        waiting = set()
+        for dest, x in errors:
+            if x not in listed:
+                continue
+            attempt, retry_at = result['retries'].get(x, (0, None))
+            if retry_at is None:
+                result['retries'][x] = (attempt, now + self.__retry_delay * 2 ** attempt)
+                waiting.add(x)
+            elif retry_at > now:
+                waiting.add(x)
+            else:
+                payload = pipe.hget(task, 'job_%s' % x)
+                if payload is None:  # job from previous version. nothing to resend
+                    continue
+                payload = self.__spill.load([('job_%s' % x, payload)])[0]
+                if payload is None:  # data file lost
+                    continue
+                payload = self.__serializer.loads(payload)
+                if attempt < self.__retry_attempts:
+                    retry.append((dest, x, str(uuid4()), payload, attempt + 1))
+                else:
+                    rejected.append((x, payload, [dict(s, models=[payload['model']]) for s in payload['structures']]))
+
+        changed, cache = self.__merge_finished(pipe, task, result, legacy, finished, rejected)
+        if finished:
+            ended_at = max(x.ended_at for _, x, _ in finished)
+
+        done = [x.id for _, x, _ in finished]
+        done.extend(x for x, _, _ in rejected)
+        done.extend(x for _, x, _, _, _ in retry)
+        for x in done:
+            result['retries'].pop(x, None)
+
+        keep = unfinished.union(waiting)
+        result['jobs'] = [x for x in result['jobs'] if x[1] in keep]
+        resend = []
+        for dest, x, new, payload, attempt in retry:
+            model = payload['model']
+            other = [d for d in model['destinations']
+                     if (d['host'], d['port'], d['name']) != (dest['host'], dest['port'], dest['name'])]
+            worker = (self.__new_worker(other, result['priority']) or
+                      self.__new_worker(model['destinations'], result['priority']))
+            if worker is None:  # all destinations unavailable. job lost on next poll.
+                worker = dest, None
+            result['jobs'].append((worker[0], new))
+            result['retries'][new] = (attempt, None)
+            if x in result['pending']:  # file upload job
+                result['pending'][new] = result['pending'].pop(x)
+            resend.append((worker, new, payload))
+
+        pipe.multi()
+        if legacy is not None:
+            pipe.delete(task)
+        self.__save_task(pipe, task, result, ended_at, changed.values(),
+                         {'job_%s' % new: self.__serializer.dumps(payload) for _, new, payload in resend})
+        self.__admission.track(pipe, result['user'], task, len(result['pending']))
+        if done:
+            pipe.hdel(task, *('job_%s' % x for x in done))
+        return result, ended_at, finished, cache, resend
+
+    def __merge_finished(self, pipe, task, result, legacy, finished, rejected):
+        """ add structures of finished and rejected jobs to task data. return changed structures and results for cache.
+        """
+        index = set(result['index'])
+        returned = [s for _, _, value in finished for s in value]
+        returned.extend(s for _, _, value in rejected for s in value)
+        exists = list({s['structure'] for s in returned if s['structure'] in index})
+        changed = legacy or {k: v for k, v in zip(exists, self.__load_structures(pipe, task, exists, legacy))
+                             if v is not None}
+        for s in returned:
+            if s['structure'] in changed:
+                changed[s['structure']]['models'].extend(s['models'])
+            else:
+                changed[s['structure']] = s
+
+        cache = []
+        signatures = {} if legacy is not None else self.__load_signatures(pipe, task, finished)
+        for _, j, value in finished:
+            signature = signatures.get(j.id)
+            if not signature:
+                continue
+            for s in value:
+                for m in s['models']:
+                    # failed models not cached
+                    if m['model'] == j.kwargs['model']['model'] and m.get('results') and s['structure'] in signature:
+                        cache.append((m['model'], signature[s['structure']], m))
+
+        if finished or rejected:
+            result['index'] = sorted(index.union(changed))
+            # progress counted by sent structures. file upload job returns other structures.
+            # jobs of tasks saved by previous version can be not counted.
+            for x, kwargs in [(x.id, x.kwargs) for _, x, _ in finished] + [(x, y) for x, y, _ in rejected]:
+                progress = result['progress'].setdefault(kwargs['model']['model'], [0, 0])
+                progress[0] += len(kwargs['structures'])
+                progress[1] = max(progress)
+                for s in kwargs['structures']:
+                    key = s.get('structure', x)  # file upload placeholder counted by job
+                    if result['pending'].get(key, 0) > 1:
+                        result['pending'][key] -= 1
+                    else:
+                        result['pending'].pop(key, None)
+        return changed, cache
+
+    def __load_signatures(self, conn, task, finished):
+        """ cache signatures of finished jobs structures from saved jobs data.
+        """
+        if not self.__cache.enabled or not finished:
+            return {}
+        fields = ['job_%s' % j.id for _, j, _ in finished]
+        signatures = {}
+        for (_, j, _), payload in zip(finished, self.__spill.load(zip(fields, conn.hmget(task, fields)))):
+            if payload is not None:
+                signatures[j.id] = self.__serializer.loads(payload).get('signatures')
+        return signatures
+
+    @staticmethod
+    def __stop_jobs(queue, sub_tasks):
+        """ remove queued and finished jobs of destination. running jobs stopped by workers.
+        """
+        jobs = Job.fetch_many(sub_tasks, connection=queue.connection, serializer=queue.serializer)
+        running = []
+        with queue.connection.pipeline() as pipe:
+            for j in jobs:
+                if j is None:
+                    continue
+                if j.get_status(refresh=False) == JobStatus.STARTED and j.worker_name:
+                    running.append(j)
+                else:
+                    j.delete(pipeline=pipe)
+            pipe.execute()
+
+        for j in running:  # worker moves stopped job to failed registry
+            send_command(queue.connection, j.worker_name, 'stop-job', job_id=j.id)
+
+    def __cancel(self, pipe, task, user, finished):
+        """ merge finished jobs, mark task of user cancelled and forget other jobs.
+        called in WATCH transaction on task key.
+        """
+        loaded = self.__load_task(pipe, task)
+        if loaded is None:
             return None
 
-    def new_job(self, task):
+        result, ended_at, legacy = loaded
+        jobs = result['jobs']
+        if result['user'] != user or not jobs:
+            return result, ended_at, [], [], []
+
+        listed = {x for _, x in jobs}
+        finished = [x for x in finished if x[1].id in listed]
+        changed, cache = self.__merge_finished(pipe, task, result, legacy, finished, [])
+        if finished:
+            ended_at = max(x.ended_at for _, x, _ in finished)
+
+        # structures of unfinished jobs dropped from task
+        progress = {m: [d, d] for m, (d, _) in result['progress'].items()}
+        result.update(status=TaskStatus.CANCELLED, jobs=[], retries={}, pending={}, progress=progress)
+        pipe.multi()
+        if legacy is not None:
+            pipe.delete(task)
+        self.__save_task(pipe, task, result, ended_at, changed.values())
+        pipe.hdel(task, *('job_%s' % x for _, x in jobs))
+        self.__admission.track(pipe, user, task, 0)
+        return result, ended_at, jobs, finished, cache
+
+    @staticmethod
+    def __kwargs(payload):
+        return dict(structures=payload['structures'], model=payload['model'])
+
+    def __enqueue(self, worker, kwargs, task, job_id=None, at_front=False, timeout=None):
+        return worker.enqueue_call('redis_worker.run', kwargs=self.__kwargs(kwargs), result_ttl=self.__result_ttl,
+                                   timeout=timeout, meta=dict(task=task), job_id=job_id, at_front=at_front,
+                                   **self.__callbacks).id
+
+    def __enqueue_many(self, worker, payloads, task, at_front=False):
+        """ enqueue jobs to one queue in single transaction. all or nothing.
+        """
+        if at_front:  # keep order of chunks
+            payloads = payloads[::-1]
+        return worker.enqueue_many([worker.prepare_data('redis_worker.run', kwargs=self.__kwargs(kwargs),
+                                                        result_ttl=self.__result_ttl, timeout=timeout,
+                                                        meta=dict(task=task), job_id=job_id, at_front=at_front,
+                                                        **self.__callbacks)
+                                    for job_id, kwargs, timeout in payloads])
+
+    def __save_task(self, pipe, task, result, ended_at, structures, jobs=None):
+        """ task stored as hash. meta field contains task data and ordered index of structures ids.
+        each structure stored in field named by structure id. jobs is dict of serialized jobs data fields.
+
+        large data of structures and jobs spilled to file. meta keeps list of task files.
+        """
+        mapping = {str(s['structure']): self.__serializer.dumps(s) for s in structures}
+        if jobs:
+            mapping.update(jobs)
+        mapping, digest = self.__spill.dump(mapping)
+        if digest is not None and digest not in result['files']:
+            result['files'].append(digest)
+        self.__spill.touch(result['files'])
+        mapping['meta'] = self.__serializer.dumps((result, ended_at))
+        pipe.hset(task, mapping=mapping)
+        pipe.expire(task, self.__result_ttl)
+
+    def __load_task(self, conn, task):
+        """ load task meta without structures. for tasks stored as one blob also return structures dict.
+        """
+        try:
+            meta = conn.hget(task, 'meta')
+        except ResponseError:  # task saved in old format as single pickled blob.
+            meta = conn.get(task)
+            if meta is None:
+                return None
+            result, ended_at = self.__serializer.loads(meta)
+            legacy = {s['structure']: s for s in result.pop('structures')}
+            result['index'] = sorted(legacy)
+        else:
+            if meta is None:
+                return None
+            result, ended_at = self.__serializer.loads(meta)
+            legacy = None
+
+        if 'progress' not in result:  # task of previous version
+            self.__restore_progress(conn, task, result, legacy)
+        result.pop('cache', None)  # signatures of previous version
+        result.setdefault('retries', {})
+        result.setdefault('priority', JobPriority.INTERACTIVE)
+        result.setdefault('files', [])
+        return result, ended_at, legacy
+
+    def __restore_progress(self, conn, task, result, legacy):
+        """ count pending structures and progress of task saved without them by data of unfinished jobs.
+        jobs without saved data not counted.
+        """
+        pending = defaultdict(int)
+        progress = defaultdict(lambda: [0, 0])
+        jobs = [x for _, x in result['jobs']]
+        if jobs and legacy is None:
+            fields = ['job_%s' % x for x in jobs]
+            for x, payload in zip(jobs, self.__spill.load(zip(fields, conn.hmget(task, fields)))):
+                if payload is None:
+                    continue
+                payload = self.__serializer.loads(payload)
+                progress[payload['model']['model']][1] += len(payload['structures'])
+                for s in payload['structures']:
+                    pending[s.get('structure', x)] += 1
+        result['pending'] = dict(pending)
+        result['progress'] = dict(progress)
+
+    def __load_structures(self, conn, task, ids, legacy=None):
+        if legacy is not None:
+            return [legacy[x] for x in ids]
+        if not ids:
+            return []
+        fields = [str(x) for x in ids]
+        return [x and self.__serializer.loads(x) for x in self.__spill.load(zip(fields, conn.hmget(task, fields)))]
+
+    def __iter_structures(self, task, ids, legacy=None, batch=100):
+        """ lazy loading of structures by batches. memory bounded by batch and indices of two spill files.
+        """
+        if legacy is not None:
+            yield from (legacy[x] for x in ids)
+            return
+
+        files = {}
+        for n in range(0, len(ids), batch):
+            fields = [str(x) for x in ids[n: n + batch]]
+            try:
+                values = self.__tasks.hmget(task, fields)
+            except unavailable:  # response already started. stream cut
+                self.__health.failure(self.__server)
+                raise
+            if len(files) > 1:
+                files.clear()
+            for x in self.__spill.load(zip(fields, values), files):
+                if x is not None:  # lost structure
+                    yield self.__serializer.loads(x)
+
+    def metrics(self):
+        """ dispatching metrics in prometheus text format. queue depths loaded from modeling servers.
+        """
+        for dest, connection, queues in list(self.__destinations.values()):
+            queues = list(queues.values())
+            try:
+                with connection.pipeline(transaction=False) as pipe:
+                    for q in queues:
+                        pipe.llen(q.key)
+                    for q, depth in zip(queues, pipe.execute()):
+                        self.__queue_depth.set(depth, destination=self.__name(dest, q))
+            except unavailable:
+                pass
+
+        return render([self.__enqueued, self.__enqueue_errors, self.__queue_depth, self.__queue_wait,
+                       self.__run_time, self.__polls, self.__rtt])
+
+    def invalidate_model(self, model):
+        """ drop cached results of re-registered model.
+        """
+        try:
+            self.__cache.invalidate(model)
+        except unavailable:
+            self.__health.failure(self.__server)
+
+    def reset_destinations(self, destinations):
+        """ drop cached connections and queues of destinations. next request reconnects.
+        """
+        for d in destinations:
+            self.__drop_queue((d['host'], d['port'], d['name']))
+
+    def admit(self, user, size):
+        """ check rate and structures in flight limits of user before new task creation.
+        return 0 or seconds before retry.
+        """
+        if not self.__health.allow(self.__server):
+            return 0  # new_job fails anyway
+
+        try:
+            return self.__admission.admit(user, size)
+        except unavailable:
+            self.__health.failure(self.__server)
+            return 0
+
+    def new_job(self, task, priority=None):
+        """ send task structures to modeling servers. priority lane chosen by task size if not given.
+        """
         if task['status'] not in (TaskStatus.NEW, TaskStatus.PREPARING, TaskStatus.MODELING):
             return None  # for api check.
 
+        if not self.__health.allow(self.__server):
+            return None
+
         try:
-            self.__tasks.ping()
-        except ConnectionError:
+            job = self.__new_job(task, priority)
+        except unavailable:
+            self.__health.failure(self.__server)
             return None
 
+        self.__health.success(self.__server)
+        return job
+
+    def __new_job(self, task, priority):
         model_worker = {}
         model_struct = defaultdict(list)
         tmp = []
 
+        if task['status'] == TaskStatus.MODELING:
+            pairs = [(s, x['model']) for s in task['structures'] for x in s['models']
+                     if x['type'] != ModelType.PREPARER]
+            signatures = {(s['structure'], m): (m, self.__cache.signature(s, m))
+                          for s, m in pairs} if self.__cache.enabled else {}
+            hits = self.__cache.get_many(signatures)
+            size = len(pairs) - len(hits)
+        else:
+            signatures = hits = {}
+            size = sum(1 for s in task['structures'] if s['status'] == StructureStatus.RAW)
+            if any(isinstance(s['data'], dict) for s in task['structures']):  # file upload. size unknown.
+                priority = priority or JobPriority.BATCH
+
+        priority, at_front = self.__priority(task, size, priority)
+        task['priority'] = priority
+        pending = defaultdict(int)  # structure: count of unfinished models
+        progress = defaultdict(lambda: [0, 0])  # model: done and total structures
+
         for s in task['structures']:
             # check for models in structures
+            cached = []
             if task['status'] == TaskStatus.MODELING:
-                models = [(x['model'], x) for x in s.pop('models') if x['type'] != ModelType.PREPARER]
+                models = []
+                for x in s.pop('models'):
+                    if x['type'] != ModelType.PREPARER:
+                        hit = hits.get((s['structure'], x['model']))
+                        if hit is not None:
+                            cached.append(hit)
+                            progress[x['model']][0] += 1
+                            progress[x['model']][1] += 1
+                        else:
+                            models.append((x['model'], x))
             elif s['status'] == StructureStatus.RAW:
                 models = [next((x['model'], x) for x in s.pop('models') if x['type'] == ModelType.PREPARER)]
             else:  # clean or error structures in prepare task.
@@ -71,79 +601,302 @@ class RedisCombiner(object):
 
             failed = []
             for m, model in models:
-                if (model_worker.get(m) or
-                        model_worker.setdefault(m, (self.__new_worker(model['destinations']), model)))[0] is not None:
+                if m not in model_worker:
+                    model_worker[m] = self.__new_worker(model['destinations'], priority), model
+                if model_worker[m][0] is not None:
                     model_struct[m].append(s)
+                    progress[m][1] += 1
+                    if 'structure' not in s:  # file upload placeholder counted by job
+                        continue
+                    pending[s['structure']] += 1
                 else:
                     failed.append(model)
 
-            if (failed or not models) and not isinstance(s['data'], dict):
-                """ save failed models in structures.
+            if (failed or cached or not models) and not isinstance(s['data'], dict):
+                """ save failed and cached models in structures.
                 ad-hoc: file upload task return empty structures list.
                 store in redis failed or unused structures.
                 """
-                s.setdefault('models', failed)
-                tmp.append(s)
+                tmp.append(dict(s, models=failed + cached))
+
+        task.pop('structures')
+        task['index'] = sorted(s['structure'] for s in tmp)
+        task['progress'] = dict(progress)
+        new_job = []
+        for m, s in model_struct.items():
+            w, model = model_worker[m]
+            for n, chunk in enumerate(self.__split(s)):
+                # first chunk goes to already selected worker. other spread over all destinations of model.
+                job = {'structures': chunk, 'model': model}
+                signature = {x['structure']: signatures[(x['structure'], m)][1] for x in chunk
+                             if (x['structure'], m) in signatures}
+                if signature:  # for caching of results. kept in task with job data only
+                    job['signatures'] = signature
+                new_job.append((n and self.__new_worker(model['destinations'], priority) or w, job))
+
+        _id = str(uuid4())
+        jobs = [(dest, str(uuid4())) for (dest, _), _ in new_job]
+        for (_, x), (_, d) in zip(jobs, new_job):
+            if any('structure' not in s for s in d['structures']):
+                pending[x] += 1
+        task['pending'] = dict(pending)
+        estimates = self.__runtime.estimates(model_struct)
+        groups = OrderedDict()  # one round trip per queue
+        for ((dest, w), d), (_, job_id) in zip(new_job, jobs):
+            timeout = self.__runtime.timeout(estimates[d['model']['model']], len(d['structures']))
+            groups.setdefault(id(w), (dest, w, []))[2].append((job_id, d, timeout))
+
+        sent = []
+        for dest, w, payloads in groups.values():
+            try:
+                sent.extend((w, j, None) for j in self.__enqueue_many(w, payloads, _id, at_front=at_front))
+            except unavailable:  # destination died after selection. fetch_job resends jobs to alive destination.
+                self.__fail(dest)
+                self.__enqueue_errors.inc(len(payloads), destination=self.__name(dest, w))
+            except Exception as err:
+                print("new_job->ERROR:", err)
+                self.__enqueue_errors.inc(len(payloads), destination=self.__name(dest, w))
+                self.__delete_jobs(sent)  # task not saved. withdraw already sent jobs.
+                return None
+            else:
+                for _, d, _ in payloads:
+                    self.__enqueued.inc(model=d['model']['model'], destination=self.__name(dest, w),
+                                        priority=priority.name)
 
-        task['structures'] = tmp
-        new_job = ((w, {'structures': s, 'model': m})
-                   for (w, m), s in ((model_worker[m], s) for m, s in model_struct.items()))
+        task['jobs'] = jobs
+        task['retries'] = {}
+        task['files'] = []
+        task['status'] = TaskStatus.DONE if task['status'] == TaskStatus.MODELING else TaskStatus.PREPARED
 
         try:
-            jobs = [(dest, w.enqueue_call('redis_worker.run', kwargs=d, result_ttl=self.__result_ttl).id)
-                    for (dest, w), d in new_job]
+            with self.__tasks.pipeline() as pipe:
+                # keep jobs data for resending
+                self.__save_task(pipe, _id, task, datetime.utcnow(), tmp,
+                                 {'job_%s' % x: self.__serializer.dumps(d) for (_, x), (_, d) in zip(jobs, new_job)})
+                self.__admission.track(pipe, task['user'], _id, len(pending))
+                pipe.execute()
+        except unavailable:
+            self.__delete_jobs(sent)
+            raise
+        return dict(id=_id, created_at=datetime.utcnow())
 
-            task['jobs'] = jobs
-            task['status'] = TaskStatus.DONE if task['status'] == TaskStatus.MODELING else TaskStatus.PREPARED
+    def cancel_job(self, task, user):
+        """ cancel unfinished task of user. results of finished jobs merged into task.
+        queued jobs removed from queues, running jobs stopped.
 
-            _id = str(uuid4())
-            self.__tasks.set(_id, pickle.dumps((task, datetime.utcnow())), ex=self.__result_ttl)
-            return dict(id=_id, created_at=datetime.utcnow())
-        except Exception as err:
-            print("new_job->ERROR:", err)
+        return task data without structures. task of other user or finished task not changed.
+        """
+        if not self.__health.allow(self.__server):
+            return False
+
+        try:
+            loaded = self.__load_task(self.__tasks, task)
+            if loaded is None:
+                return None
+
+            finished = []  # results of finished jobs kept in task
+            if loaded[0]['user'] == user:
+                for dest, sub_tasks in self.__group_jobs(loaded[0]['jobs']):
+                    queue = self.__get_queue(dest, loaded[0]['priority'])
+                    if queue is None:
+                        continue
+                    try:
+                        jobs = self.__fetch_jobs(queue, sub_tasks)
+                    except unavailable:
+                        self.__fail(dest)
+                        continue
+                    finished.extend((queue, j, value) for j, value in jobs if j is not None and value is not None and
+                                    j.get_status(refresh=False) == JobStatus.FINISHED)
+
+            cancelled = self.__tasks.transaction(lambda pipe: self.__cancel(pipe, task, user, finished), task,
+                                                 value_from_callable=True)
+        except unavailable:
+            self.__health.failure(self.__server)
+            return False
+
+        if cancelled is None:
             return None
 
-    def fetch_job(self, task):
+        result, ended_at, jobs, finished, cache = cancelled
+        self.__cache.set_many(cache)
+        for dest, sub_tasks in self.__group_jobs(jobs):
+            queue = self.__get_queue(dest, result['priority'])
+            if queue is None:  # jobs of dead server expire
+                continue
+            try:
+                self.__stop_jobs(queue, sub_tasks)
+            except unavailable:
+                self.__fail(dest)
+
+        self.__health.success(self.__server)
+        return dict(ended_at=ended_at, result=result)
+
+    def wait_job(self, task, timeout=10, interval=5):
+        """ fetch_job which blocks until task finished or timeout. task returned without structures.
+
+        task rechecked on every jobs finish event published by workers or every interval seconds.
+        """
+        if not self.__health.allow(self.__server):
+            return False
+
+        try:
+            events = self.__tasks.pubsub(ignore_subscribe_messages=True)
+            events.subscribe('MWUI_TASK_%s' % task)  # subscribe before check. finish events can't be lost.
+        except unavailable:
+            self.__health.failure(self.__server)
+            return False
+
+        try:
+            deadline = monotonic() + timeout
+            while True:
+                job = self.fetch_job(task, structures=False)
+                if not job or job['is_finished']:
+                    return job
+
+                left = deadline - monotonic()
+                if left <= 0:
+                    return job
+
+                stop = monotonic() + min(left, interval)
+                while monotonic() < stop:
+                    if events.get_message(timeout=max(stop - monotonic(), 0)) is not None:
+                        while events.get_message() is not None:  # skip other finished jobs events
+                            pass
+                        break
+        except unavailable:
+            self.__health.failure(self.__server)
+            return False
+        finally:
+            events.close()
+
+    def fetch_job(self, task, page=None, pagesize=10, partial=False, stream=False, structures=True):
+        """ load task and merge finished jobs. for finished task return all structures or only given page.
+
+        unfinished task returned without structures. in partial mode with structures which all models finished.
+        task progress returned in both cases. in stream mode structures is iterator loading structures by batches.
+        with structures=False only task data and progress loaded.
+        """
+        if not self.__health.allow(self.__server):
+            return False
+
         try:
-            self.__tasks.ping()
-        except ConnectionError:
+            job = self.__fetch_job(task, page, pagesize, partial, stream, structures)
+        except unavailable:
+            self.__health.failure(self.__server)
+            self.__polls.inc(result='error')
             return False
 
-        job = self.__tasks.get(task)
-        if job is None:
+        self.__health.success(self.__server)
+        self.__polls.inc(result='missing' if job is None else 'finished' if job['is_finished'] else 'unfinished')
+        return job
+
+    def __fetch_job(self, task, page, pagesize, partial, stream, structures):
+        start = perf_counter()
+        loaded = self.__load_task(self.__tasks, task)
+        self.__rtt.observe(perf_counter() - start, server='%s:%s' % self.__server)
+        if loaded is None:
             return None
 
-        result, ended_at = pickle.loads(job)
+        result, ended_at, legacy = loaded
 
         sub_jobs_fin = []
         sub_jobs_unf = []
-        for dest, sub_task in result['jobs']:
-            worker = self.__get_queue(dest)
-            if worker is not None:  # skip lost workers
-                tmp = worker.fetch_job(sub_task)
-                if tmp is not None:
-                    if tmp.is_finished:
-                        sub_jobs_fin.append(tmp)
-                    elif not tmp.is_failed:  # skip failed jobs
-                        sub_jobs_unf.append((dest, sub_task))
-
-        if sub_jobs_fin:
-            tmp = {s['structure']: s for s in result['structures']}  # not modeled structures
-            for j in sub_jobs_fin:
-                for s in j.result:
-                    if s['structure'] in tmp:
-                        tmp[s['structure']]['models'].extend(s['models'])
+        sub_jobs_err = []
+        names = {}
+        for dest, sub_tasks in self.__group_jobs(result['jobs']):
+            worker = self.__get_queue(dest, result['priority'])
+            if worker is None:  # lost workers
+                sub_jobs_err.extend((dest, x) for x in sub_tasks)
+                continue
+
+            try:
+                start = perf_counter()
+                jobs = self.__fetch_jobs(worker, sub_tasks)
+            except unavailable:  # cached connection is dead. reconnect on next request.
+                self.__fail(dest)
+                sub_jobs_unf.extend((dest, x) for x in sub_tasks)
+                continue
+            self.__rtt.observe(perf_counter() - start, server='%s:%s' % (dest['host'], dest['port']))
+            self.__health.success((dest['host'], dest['port']))
+
+            for sub_task, (tmp, value) in zip(sub_tasks, jobs):
+                if tmp is None:  # lost job
+                    sub_jobs_err.append((dest, sub_task))
+                    continue
+
+                status = tmp.get_status(refresh=False)
+                if status == JobStatus.FINISHED and value is None:  # result expired or lost
+                    sub_jobs_err.append((dest, sub_task))
+                elif status == JobStatus.FINISHED:
+                    sub_jobs_fin.append((worker, tmp, value))
+                    names[tmp.id] = self.__name(dest, worker)
+                    if tmp.started_at and tmp.ended_at:
+                        self.__scheduler.observe(dest, worker, (tmp.ended_at - tmp.started_at).total_seconds())
+                elif status in (JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED):
+                    sub_jobs_err.append((dest, sub_task))
+                else:
+                    sub_jobs_unf.append((dest, sub_task))
+
+        now = time()
+        due = [x for x in (result['retries'].get(x, (0, None))[1] for _, x in sub_jobs_err) if x is None or x <= now]
+        if sub_jobs_fin or due:
+            unfinished = {x for _, x in sub_jobs_unf}
+            merged = self.__tasks.transaction(lambda pipe: self.__merge(pipe, task, sub_jobs_fin, unfinished,
+                                                                        sub_jobs_err),
+                                              task, value_from_callable=True)
+            if merged is None:  # task expired
+                return None
+
+            result, ended_at, sub_jobs_fin, cache, resend = merged
+            legacy = None
+            estimates = self.__runtime.estimates({payload['model']['model'] for _, _, payload in resend})
+            for (dest, worker), new, payload in resend:
+                if worker is not None:
+                    timeout = self.__runtime.timeout(estimates[payload['model']['model']], len(payload['structures']),
+                                                     result['retries'][new][0])
+                    try:
+                        self.__enqueue(worker, payload, task, job_id=new, timeout=timeout)
+                    except unavailable:  # job lost. will be resent on next poll.
+                        self.__fail(dest)
+                        self.__enqueue_errors.inc(destination=self.__name(dest, worker))
                     else:
-                        tmp[s['structure']] = s
-                j.delete()
+                        self.__enqueued.inc(model=payload['model']['model'], destination=self.__name(dest, worker),
+                                            priority=result['priority'].name)
 
-            result['structures'] = list(tmp.values())
-            result['jobs'] = sub_jobs_unf
-            ended_at = max(x.ended_at for x in sub_jobs_fin)
+            for worker, j, _ in sub_jobs_fin:  # only merged jobs counted
+                if j.enqueued_at and j.started_at and j.ended_at:
+                    run = (j.ended_at - j.started_at).total_seconds()
+                    labels = dict(model=j.kwargs['model']['model'], destination=names[j.id])
+                    self.__queue_wait.observe((j.started_at - j.enqueued_at).total_seconds(), **labels)
+                    self.__run_time.observe(run, **labels)
+                    self.__runtime.observe(labels['model'], len(j.kwargs['structures']), run)
 
-            self.__tasks.set(task, pickle.dumps((result, ended_at)), ex=self.__result_ttl)
+            self.__delete_jobs(sub_jobs_fin)
+            self.__cache.set_many(cache)
+            sub_jobs_unf = result['jobs']
+        elif sub_jobs_err:  # wait for resend
+            sub_jobs_unf = sub_jobs_err
 
+        ids = result.pop('index')
+        pending = result.pop('pending')
+        progress = result.pop('progress')
+        total = len(pending.keys() | ids)
+        unfinished = [m for m, (d, t) in progress.items() if d < t] if pending else []  # cancelled task
+        eta = self.__runtime.eta(self.__runtime.estimates(unfinished), progress) if unfinished else 0
+        result['progress'] = dict(done=total - len(pending), total=total, eta=eta,
+                                  models={m: tuple(x) for m, x in progress.items()})
         if sub_jobs_unf:
-            return dict(is_finished=False)
+            if not partial:
+                return dict(is_finished=False, ended_at=ended_at, result=result)
+            ids = [x for x in ids if x not in pending]
 
-        return dict(is_finished=True, ended_at=ended_at, result=result)
+        if not structures:
+            return dict(is_finished=not sub_jobs_unf, ended_at=ended_at, result=result)
+        if page:
+            ids = ids[(page - 1) * pagesize: page * pagesize]
+        if stream:
+            result['structures'] = self.__iter_structures(task, ids, legacy)
+        else:
+            result['structures'] = [x for x in self.__load_structures(self.__tasks, task, ids, legacy)
+                                    if x is not None]
+        return dict(is_finished=not sub_jobs_unf, ended_at=ended_at, result=result)
@@ -18,33 +18,49 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA 02110-1301, USA.
 #
+import json
 import uuid
-from collections import defaultdict
 from os import path
-from flask import url_for, request, Response
+from flask import url_for, request, Response, stream_with_context
 from werkzeug.exceptions import HTTPException, Aborter
 from flask_login import current_user, login_user
 from flask_restful import reqparse, marshal, inputs, Resource
 from functools import wraps
-from pony.orm import db_session, select, left_join
+from hashlib import sha1
+from pony.orm import db_session
 from validators import url
 from werkzeug import datastructures
 from typing import Dict, Tuple
 from flask_restful_swagger import swagger
-from .data import get_additives, get_model, get_models_list, format_results
+from .data import get_additives, get_model, get_models_list, format_results, stream_results, catalog
 from .structures import (ModelRegisterFields, TaskPostResponseFields, TaskGetResponseFields, TaskStructureFields,
                          LogInFields, AdditivesListFields, ModelListFields)
+from ..health import health
 from ..logins import UserLogin
 from ..config import (UPLOAD_PATH, REDIS_HOST, REDIS_JOB_TIMEOUT, REDIS_PASSWORD, REDIS_PORT, REDIS_TTL,
+                      REDIS_SCHEDULER, REDIS_CHUNK_SIZE, REDIS_EVENTS, REDIS_WAIT_TIMEOUT, REDIS_CACHE_TTL,
+                      REDIS_CACHE_SIZE, REDIS_RETRY_ATTEMPTS, REDIS_RETRY_DELAY, REDIS_CONNECT_TIMEOUT,
+                      REDIS_COMPRESS_THRESHOLD, REDIS_LANES, REDIS_INTERACTIVE_SIZE, REDIS_SHARE_WINDOW,
+                      REDIS_SHARE_LIMIT, REDIS_RATE_LIMIT, REDIS_RATE_BURST, REDIS_INFLIGHT_LIMIT,
+                      REDIS_JOB_MIN_TIMEOUT, REDIS_JOB_TIMEOUT_MARGIN, REDIS_SPILL_THRESHOLD, REDIS_SOCKET_TIMEOUT,
                       BLOG_POSTS_PER_PAGE)
 from ..constants import (StructureStatus, TaskStatus, ModelType, TaskType, StructureType, UserRole, AdditiveType,
                          ResultType)
-from ..models import Task, Structure, Additive, Model, Additiveset, Destination, User, Result
+from ..models import Task, Model, Destination, User
 from .redis import RedisCombiner
 
 
 redis = RedisCombiner(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, result_ttl=REDIS_TTL,
-                      job_timeout=REDIS_JOB_TIMEOUT)
+                      job_timeout=REDIS_JOB_TIMEOUT, scheduler=REDIS_SCHEDULER, chunk_size=REDIS_CHUNK_SIZE,
+                      events=REDIS_EVENTS, cache_ttl=REDIS_CACHE_TTL, cache_size=REDIS_CACHE_SIZE,
+                      retry_attempts=REDIS_RETRY_ATTEMPTS, retry_delay=REDIS_RETRY_DELAY,
+                      connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_SOCKET_TIMEOUT, health=health,
+                      compress_threshold=REDIS_COMPRESS_THRESHOLD, lanes=REDIS_LANES,
+                      interactive_size=REDIS_INTERACTIVE_SIZE, share_window=REDIS_SHARE_WINDOW,
+                      share_limit=REDIS_SHARE_LIMIT, rate=REDIS_RATE_LIMIT, burst=REDIS_RATE_BURST,
+                      inflight=REDIS_INFLIGHT_LIMIT, min_timeout=REDIS_JOB_MIN_TIMEOUT,
+                      timeout_margin=REDIS_JOB_TIMEOUT_MARGIN, spill_path=path.join(UPLOAD_PATH, 'tasks'),
+                      spill_threshold=REDIS_SPILL_THRESHOLD)
 
 task_types_desc = ', '.join('{0.value} - {0.name}'.format(x) for x in TaskType)
 results_types_desc = ', '.join('{0.value} - {0.name}'.format(x) for x in ResultType)
@@ -69,26 +85,52 @@ def abort(http_status_code, **kwargs):
         raise
 
 
-def fetch_task(task, status):
-    job = redis.fetch_job(task)
+def fetch_task(task, status, page=None, partial=False, stream=False, cancelled=False):
+    """ load finished task of current user with given status. cancelled task also acceptable if cancelled=True.
+    """
+    job = redis.fetch_job(task, page=page, pagesize=BLOG_POSTS_PER_PAGE, partial=partial, stream=stream)
     if job is None:
         abort(404, message='invalid task id. perhaps this task has already been removed')
 
     if not job:
         abort(500, message='modeling server error')
 
-    if not job['is_finished']:
-        abort(512, message='PROCESSING.Task not ready')
-
-    if job['result']['status'] != status:
-        abort(406, message='task status is invalid. task status is [%s]' % job['result']['status'].name)
-
     if job['result']['user'] != current_user.id:
         abort(403, message='user access deny. you do not have permission to this task')
 
+    if not job['is_finished'] and not partial:
+        progress = job['result']['progress']
+        abort(512, message='PROCESSING.Task not ready',
+              progress=dict(done=progress['done'], total=progress['total'], eta=progress['eta']))
+
+    if job['result']['status'] != status and not (cancelled and job['result']['status'] == TaskStatus.CANCELLED):
+        abort(406, message='task status is invalid. task status is [%s]' % job['result']['status'].name)
+
     return job['result'], job['ended_at']
 
 
+def results_response(task, fetched, stream):
+    if stream:
+        return Response(stream_with_context(stream_results(task, fetched)), mimetype='application/x-ndjson')
+    return format_results(task, fetched), 200
+
+
+def admit(size):
+    """ check task creation limits of current user.
+    """
+    if REDIS_INFLIGHT_LIMIT and size > REDIS_INFLIGHT_LIMIT:
+        abort(413, message='too many structures in task. max allowed %d' % REDIS_INFLIGHT_LIMIT)
+
+    retry = redis.admit(current_user.id, size)
+    if retry:
+        try:
+            original_flask_abort(429)
+        except HTTPException as e:
+            e.retry_after = retry  # Retry-After header
+            e.data = dict(message='too many tasks. retry after %d seconds' % retry, retry_after=retry)
+            raise
+
+
 def dynamic_docstring(*sub):
     def wrapper(f):
         f.__doc__ = f.__doc__.format(*sub)
@@ -97,6 +139,33 @@ def dynamic_docstring(*sub):
     return wrapper
 
 
+def conditional(tag=None):
+    """ ETag and Cache-Control for rarely changed resources. 304 response if client has same version.
+
+    tag is callable which returns version of resource. without tag digest of response data used.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            data = None
+            etag = tag and tag()
+            if etag is None:
+                data, code = f(*args, **kwargs)
+                etag = sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+            headers = {'ETag': '"%s"' % etag, 'Cache-Control': 'private, no-cache'}
+            if request.if_none_match.contains(etag):
+                return Response(status=304, headers=headers)
+
+            if data is None:
+                data, code = f(*args, **kwargs)
+            return data, code, headers
+
+        return wrapper
+
+    return decorator
+
+
 def authenticate(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -139,6 +208,7 @@ class RegisterModels(AdminResource):
         report = []
         for m in models:
             if m['destinations']:
+                redis.reset_destinations(m['destinations'])
                 if m['name'] not in available:
                     with db_session:
                         new_m = Model(type=m['type'], name=m['name'], description=m['description'],
@@ -156,6 +226,7 @@ class RegisterModels(AdminResource):
                     tmp = []
                     with db_session:
                         model = Model.get(name=m['name'])
+                        redis.invalidate_model(model.id)
                         for d in m['destinations']:
                             if (d['host'], d['port'], d['name']) not in available[m['name']]:
                                 tmp.append(Destination(model=model, **d))
@@ -165,16 +236,27 @@ class RegisterModels(AdminResource):
                                            type=model.type.value, example=model.example,
                                            destinations=[dict(host=x.host, port=x.port, name=x.name)
                                                          for x in tmp]))
+        if report:  # workers reload models
+            catalog.invalidate()
         return report, 201
 
 
+class Metrics(AdminResource):
+    def get(self):
+        """ task dispatching metrics of worker process in prometheus text format.
+        """
+        return Response(redis.metrics(), mimetype='text/plain; version=0.0.4')
+
+
 class AvailableModels(AuthResource):
     @swagger.operation(
         notes='Get available models',
         nickname='modellist',
         responseClass=ModelListFields.__name__,
-        responseMessages=[dict(code=200, message="models list"), dict(code=401, message="user not authenticated")])
+        responseMessages=[dict(code=200, message="models list"), dict(code=304, message="models list not changed"),
+                          dict(code=401, message="user not authenticated")])
     @dynamic_docstring(ModelType.MOLECULE_MODELING, ModelType.REACTION_MODELING)
+    @conditional(lambda: 'models-%s' % catalog.tag())
     def get(self):
         """
         Get available models list
@@ -198,8 +280,10 @@ class AvailableAdditives(AuthResource):
         notes='Get available additives',
         nickname='additives',
         responseClass=AdditivesListFields.__name__,
-        responseMessages=[dict(code=200, message="additives list"), dict(code=401, message="user not authenticated")])
+        responseMessages=[dict(code=200, message="additives list"), dict(code=304, message="additives not changed"),
+                          dict(code=401, message="user not authenticated")])
     @dynamic_docstring(additives_types_desc)
+    @conditional(lambda: 'additives-%s' % catalog.tag())
     def get(self):
         """
         Get available additives list
@@ -220,6 +304,99 @@ class AvailableAdditives(AuthResource):
 results_fetch = reqparse.RequestParser()
 results_fetch.add_argument('page', type=inputs.positive)
 
+saved_fetch = results_fetch.copy()
+saved_fetch.add_argument('after', type=inputs.natural, default=0)
+saved_fetch.add_argument('limit', type=inputs.positive)
+
+partial_fetch = results_fetch.copy()
+partial_fetch.add_argument('partial', type=inputs.boolean, default=False)
+partial_fetch.add_argument('stream', type=inputs.boolean, default=False)
+
+wait_fetch = reqparse.RequestParser()
+wait_fetch.add_argument('timeout', type=inputs.int_range(1, REDIS_WAIT_TIMEOUT), default=REDIS_WAIT_TIMEOUT)
+
+
+class WaitTask(AuthResource):
+    @swagger.operation(
+        notes='Wait for task',
+        nickname='wait',
+        responseClass=TaskPostResponseFields.__name__,
+        parameters=[dict(name='task', description='Task ID', required=True,
+                         allowMultiple=False, dataType='str', paramType='path'),
+                    dict(name='timeout', description='max waiting time in seconds', required=False,
+                         allowMultiple=False, dataType='int', paramType='query')],
+        responseMessages=[dict(code=200, message="task ready"),
+                          dict(code=401, message="user not authenticated"),
+                          dict(code=403, message='user access deny. you do not have permission to this task'),
+                          dict(code=404, message='invalid task id. perhaps this task has already been removed'),
+                          dict(code=500, message="modeling server error"),
+                          dict(code=512, message='task not ready')])
+    def get(self, task):
+        """
+        Wait until task is ready
+
+        long polling replacement of repeated task/prepare or task/model get requests.
+        response returned as soon as task ready or after timeout with 512 code.
+        after 200 response task can be loaded by task/prepare or task/model get requests depending on task status.
+        without workers events task checked once and 512 returned immediately if not ready.
+        """
+        job = redis.wait_job(task, timeout=wait_fetch.parse_args()['timeout'] if REDIS_EVENTS else 0)
+        if job is None:
+            abort(404, message='invalid task id. perhaps this task has already been removed')
+
+        if not job:
+            abort(500, message='modeling server error')
+
+        if not job['is_finished']:
+            abort(512, message='PROCESSING.Task not ready')
+
+        result = job['result']
+        if result['user'] != current_user.id:
+            abort(403, message='user access deny. you do not have permission to this task')
+
+        return dict(task=task, status=result['status'].value, type=result['type'].value,
+                    date=job['ended_at'].strftime("%Y-%m-%d %H:%M:%S"), user=result['user']), 200
+
+
+class CancelTask(AuthResource):
+    @swagger.operation(
+        notes='Cancel task',
+        nickname='cancel',
+        responseClass=TaskPostResponseFields.__name__,
+        parameters=[dict(name='task', description='Task ID', required=True,
+                         allowMultiple=False, dataType='str', paramType='path')],
+        responseMessages=[dict(code=200, message="task cancelled"),
+                          dict(code=401, message="user not authenticated"),
+                          dict(code=403, message='user access deny. you do not have permission to this task'),
+                          dict(code=404, message='invalid task id. perhaps this task has already been removed'),
+                          dict(code=406, message='task already finished'),
+                          dict(code=500, message="modeling server error")])
+    @dynamic_docstring(TaskStatus.CANCELLED)
+    def post(self, task):
+        """
+        Cancel unfinished task
+
+        queued jobs of task removed from modeling servers queues. running jobs stopped.
+        task status changed to {0.value} [{0.name}]. structures which already processed kept in task and \
+        available by /task/model or /task/prepare get.
+        """
+        job = redis.cancel_job(task, current_user.id)
+        if job is None:
+            abort(404, message='invalid task id. perhaps this task has already been removed')
+
+        if not job:
+            abort(500, message='modeling server error')
+
+        result = job['result']
+        if result['user'] != current_user.id:
+            abort(403, message='user access deny. you do not have permission to this task')
+
+        if result['status'] != TaskStatus.CANCELLED:
+            abort(406, message='task already finished')
+
+        return dict(task=task, status=result['status'].value, type=result['type'].value,
+                    date=job['ended_at'].strftime("%Y-%m-%d %H:%M:%S"), user=result['user']), 200
+
 
 class ResultsTask(AuthResource):
     @swagger.operation(
@@ -227,7 +404,13 @@ class ResultsTask(AuthResource):
         nickname='saved',
         responseClass=TaskGetResponseFields.__name__,
         parameters=[dict(name='task', description='Task ID', required=True,
-                         allowMultiple=False, dataType='str', paramType='path')],
+                         allowMultiple=False, dataType='str', paramType='path'),
+                    dict(name='page', description='Results pagination', required=False,
+                         allowMultiple=False, dataType='int', paramType='query'),
+                    dict(name='after', description='ID of last structure of previous page', required=False,
+                         allowMultiple=False, dataType='int', paramType='query'),
+                    dict(name='limit', description='Structures on page', required=False,
+                         allowMultiple=False, dataType='int', paramType='query')],
         responseMessages=[dict(code=200, message="modeled task"),
                           dict(code=401, message="user not authenticated"),
                           dict(code=403, message='user access deny. you do not have permission to this task'),
@@ -241,13 +424,20 @@ class ResultsTask(AuthResource):
 
         all structures include only models with nonempty results lists.
         see /task/model get doc.
+
+        for big tasks use after and limit: after is structure id of last structure of previous page.
+        first page returned without after. page argument also supported but slower on far pages.
         """
         try:
             task = int(task)
         except ValueError:
             abort(404, message='invalid task id. Use int Luke')
 
-        page = results_fetch.parse_args().get('page')
+        args = saved_fetch.parse_args()
+        if args['page']:
+            limit, offset = BLOG_POSTS_PER_PAGE, (args['page'] - 1) * BLOG_POSTS_PER_PAGE
+        else:
+            limit, offset = args['limit'], 0
         with db_session:
             result = Task.get(id=task)
             if not result:
@@ -262,37 +452,17 @@ class ResultsTask(AuthResource):
 
             additives = get_additives()
 
-            s = select(s for s in Structure if s.task == result).order_by(Structure.id)
-            if page:
-                s = s.page(page, pagesize=BLOG_POSTS_PER_PAGE)
-
-            structures = {x.id: dict(structure=x.id, data=x.structure, temperature=x.temperature, pressure=x.pressure,
-                                     type=x.structure_type, status=x.structure_status, additives=[], models=[])
-                          for x in s}
-
-            r = left_join((s.id, r.model.id, r.key, r.value, r.result_type)
-                          for s in Structure for r in s.results if s.id in structures.keys() and r is not None)
-
-            a = left_join((s.id, a.additive.id, a.amount)
-                          for s in Structure for a in s.additives if s.id in structures.keys() and a is not None)
-
-            for s, a, aa in a:
-                tmp = dict(amount=aa)
-                tmp.update(additives[a])
-                structures[s]['additives'].append(tmp)
-
-            tmp_models = defaultdict(dict)
-            for s, m, rk, rv, rt in r:
-                tmp_models[s].setdefault(m, []).append(dict(key=rk, value=rv, type=rt))
-
-            for s, mr in tmp_models.items():
-                for m, r in mr.items():
-                    tmp = dict(results=r)
-                    tmp.update(models[m])
-                    structures[s]['models'].append(tmp)
+            structures = []
+            for s in result.get_structures(args['after'], limit, offset):
+                s['additives'] = [dict(additives[a], amount=aa) for a, aa in s['additives']]
+                tmp_models = {}
+                for m, rk, rv, rt in s.pop('results'):
+                    tmp_models.setdefault(m, []).append(dict(key=rk, value=rv, type=rt))
+                s['models'] = [dict(models[m], results=r) for m, r in tmp_models.items()]
+                structures.append(s)
 
         return dict(task=task, status=TaskStatus.DONE.value, date=result.date.strftime("%Y-%m-%d %H:%M:%S"),
-                    type=result.task_type, user=result.user.id, structures=list(structures.values())), 200
+                    type=result.task_type, user=result.user.id, structures=structures), 200
 
     @swagger.operation(
         notes='Save modeled task',
@@ -317,16 +487,7 @@ class ResultsTask(AuthResource):
         result, ended_at = fetch_task(task, TaskStatus.DONE)
 
         with db_session:
-            _task = Task(type=result['type'], date=ended_at, user=User[current_user.id])
-            for s in result['structures']:
-                _structure = Structure(structure=s['data'], type=s['type'], temperature=s['temperature'],
-                                       pressure=s['pressure'], status=s['status'], task=_task)
-                for a in s['additives']:
-                    Additiveset(additive=Additive[a['additive']], structure=_structure, amount=a['amount'])
-
-                for m in s['models']:
-                    for r in m.get('results', []):
-                        Result(model=m['model'], structure=_structure, type=r['type'], key=r['key'], value=r['value'])
+            _task = Task.bulk_create(User[current_user.id], ended_at, result['type'], result['structures'])
 
         return dict(task=_task.id, status=TaskStatus.DONE.value, date=ended_at.strftime("%Y-%m-%d %H:%M:%S"),
                     type=result['type'].value, user=current_user.id), 201
@@ -338,7 +499,13 @@ class ModelTask(AuthResource):
         nickname='modeled',
         responseClass=TaskGetResponseFields.__name__,
         parameters=[dict(name='task', description='Task ID', required=True,
-                         allowMultiple=False, dataType='str', paramType='path')],
+                         allowMultiple=False, dataType='str', paramType='path'),
+                    dict(name='page', description='Results pagination', required=False,
+                         allowMultiple=False, dataType='int', paramType='query'),
+                    dict(name='partial', description='Return finished structures of unfinished task',
+                         required=False, allowMultiple=False, dataType='boolean', paramType='query'),
+                    dict(name='stream', description='Return task as NDJSON stream', required=False,
+                         allowMultiple=False, dataType='boolean', paramType='query')],
         responseMessages=[dict(code=200, message="modeled task"),
                           dict(code=401, message="user not authenticated"),
                           dict(code=403, message='user access deny. you do not have permission to this task'),
@@ -357,9 +524,18 @@ class ModelTask(AuthResource):
         see also /task/prepare get doc.
 
         available model results response types: {0}
+
+        with partial=true unfinished task returned with structures which all models already finished.
+        progress contains count of done and total structures of task and of each model.
+        eta - estimated seconds to finish unfinished structures. null for models without runtime history.
+
+        with stream=true task returned as application/x-ndjson: first line is task without structures list,
+        next lines are structures. structures loaded by small batches, so big tasks can be fetched without paging.
         """
-        page = results_fetch.parse_args().get('page')
-        return format_results(task, fetch_task(task, TaskStatus.DONE), page=page), 200
+        args = partial_fetch.parse_args()
+        fetched = fetch_task(task, TaskStatus.DONE, page=args['page'], partial=args['partial'],
+                             stream=args['stream'], cancelled=True)
+        return results_response(task, fetched, args['stream'])
 
     @swagger.operation(
         notes='Create modeling task',
@@ -375,6 +551,8 @@ class ModelTask(AuthResource):
                           dict(code=403, message='user access deny. you do not have permission to this task'),
                           dict(code=404, message='invalid task id. perhaps this task has already been removed'),
                           dict(code=406, message='task status is invalid. only validation tasks acceptable'),
+                          dict(code=413, message="too many structures in task"),
+                          dict(code=429, message='too many tasks. retry after Retry-After seconds'),
                           dict(code=500, message="modeling server error"),
                           dict(code=512, message='task not ready')])
     def post(self, task):
@@ -428,6 +606,7 @@ class ModelTask(AuthResource):
         result['structures'] = list(prepared.values())
         result['status'] = TaskStatus.MODELING
 
+        admit(len(result['structures']))
         new_job = redis.new_job(result)
         if new_job is None:
             abort(500, message='modeling server error')
@@ -442,7 +621,13 @@ class PrepareTask(AuthResource):
         nickname='prepared',
         responseClass=TaskGetResponseFields.__name__,
         parameters=[dict(name='task', description='Task ID', required=True,
-                         allowMultiple=False, dataType='str', paramType='path')],
+                         allowMultiple=False, dataType='str', paramType='path'),
+                    dict(name='page', description='Results pagination', required=False,
+                         allowMultiple=False, dataType='int', paramType='query'),
+                    dict(name='partial', description='Return finished structures of unfinished task',
+                         required=False, allowMultiple=False, dataType='boolean', paramType='query'),
+                    dict(name='stream', description='Return task as NDJSON stream', required=False,
+                         allowMultiple=False, dataType='boolean', paramType='query')],
         responseMessages=[dict(code=200, message="validated task"),
                           dict(code=401, message="user not authenticated"),
                           dict(code=403, message='user access deny. you do not have permission to this task'),
@@ -470,13 +655,18 @@ class PrepareTask(AuthResource):
         {0.name} model with empty results list. In this case possible to resend this task to revalidation as is.
         for upload task failed validation return empty structure list and resend impossible.
 
+        with partial=true unfinished task returned with already validated structures.
+        stream=true also supported. see /task/model get doc.
+
         model results response structure:
         key: string - header
         type: data type = {4.value} [{4.name}] - plain text information
         value: string - body
         """
-        page = results_fetch.parse_args().get('page')
-        return format_results(task, fetch_task(task, TaskStatus.PREPARED), page=page), 200
+        args = partial_fetch.parse_args()
+        fetched = fetch_task(task, TaskStatus.PREPARED, page=args['page'], partial=args['partial'],
+                             stream=args['stream'], cancelled=True)
+        return results_response(task, fetched, args['stream'])
 
     @swagger.operation(
         notes='Create revalidation task',
@@ -492,6 +682,8 @@ class PrepareTask(AuthResource):
                           dict(code=403, message='user access deny. you do not have permission to this task'),
                           dict(code=404, message='invalid task id. perhaps this task has already been removed'),
                           dict(code=406, message='task status is invalid. only validation tasks acceptable'),
+                          dict(code=413, message="too many structures in task"),
+                          dict(code=429, message='too many tasks. retry after Retry-After seconds'),
                           dict(code=500, message="modeling server error"),
                           dict(code=512, message='task not ready')])
     @dynamic_docstring(StructureStatus.CLEAR, StructureType.REACTION, ModelType.REACTION_MODELING,
@@ -574,6 +766,7 @@ class PrepareTask(AuthResource):
         result['structures'] = list(prepared.values())
         result['status'] = TaskStatus.PREPARING
 
+        admit(len(result['structures']))
         new_job = redis.new_job(result)
         if new_job is None:
             abort(500, message='modeling server error')
@@ -595,6 +788,8 @@ class CreateTask(AuthResource):
                           dict(code=400, message="invalid structure data"),
                           dict(code=401, message="user not authenticated"),
                           dict(code=403, message="invalid task type"),
+                          dict(code=413, message="too many structures in task"),
+                          dict(code=429, message='too many tasks. retry after Retry-After seconds'),
                           dict(code=500, message="modeling server error")])
     @dynamic_docstring(AdditiveType.SOLVENT, TaskStatus.PREPARING,
                        TaskType.MODELING, TaskType.SIMILARITY, TaskType.SUBSTRUCTURE)
@@ -647,6 +842,7 @@ class CreateTask(AuthResource):
         if not data:
             abort(400, message='invalid structure data')
 
+        admit(len(data))
         new_job = redis.new_job(dict(status=TaskStatus.NEW, type=_type, user=current_user.id, structures=data))
 
         if new_job is None:
@@ -675,6 +871,7 @@ class UploadTask(AuthResource):
                           dict(code=401, message="user not authenticated"),
                           dict(code=400, message="structure file required"),
                           dict(code=403, message="invalid task type"),
+                          dict(code=429, message='too many tasks. retry after Retry-After seconds'),
                           dict(code=500, message="modeling server error")])
     def post(self, _type: int) -> Tuple[Dict, int]:
         """
@@ -718,6 +915,7 @@ class UploadTask(AuthResource):
             abort(403, message='invalid task type [%s]. valid values are %s' % (_type, task_types_desc))
 
         args = uf_post.parse_args()
+        admit(1)  # structures count unknown before file parsing
 
         file_url = None
         if args['file.url']:  # smart frontend
@@ -780,7 +978,9 @@ class MagicNumbers(AuthResource):
         nickname='magic',
         parameters=[],
         responseMessages=[dict(code=200, message="magic numbers"),
+                          dict(code=304, message="magic numbers not changed"),
                           dict(code=401, message="user not authenticated")])
+    @conditional()
     def get(self):
         """
         Get Magic numbers
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+from random import sample
+from time import monotonic, time
+from rq import Worker
+from ..health import unavailable
+
+
+class LeastLoaded(object):
+    def select(self, candidates, scheduler):
+        return min(candidates, key=lambda x: scheduler.load(*x))
+
+
+class WeightedRoundRobin(object):
+    """ smooth weighted round-robin. weight of destination is its throughput: workers / avg job duration.
+    """
+    def __init__(self):
+        self.__current = {}
+
+    def select(self, candidates, scheduler):
+        weights = [scheduler.weight(*x) for x in candidates]
+        if not any(weights):  # workers not started. just rotate
+            weights = [1] * len(weights)
+
+        total = 0
+        best = None
+        for c, w in zip(candidates, weights):
+            key = scheduler.key(*c)
+            total += w
+            self.__current[key] = self.__current.get(key, 0) + w
+            if best is None or self.__current[key] > self.__current[scheduler.key(*best)]:
+                best = c
+
+        self.__current[scheduler.key(*best)] -= total
+        return best
+
+
+class TwoChoices(object):
+    """ power of two random choices. less stats refreshing than least loaded on many destinations.
+    """
+    def select(self, candidates, scheduler):
+        if len(candidates) > 2:
+            candidates = sample(candidates, 2)
+        return min(candidates, key=lambda x: scheduler.load(*x))
+
+
+policies = dict(least_loaded=LeastLoaded, round_robin=WeightedRoundRobin, two_choices=TwoChoices)
+
+
+class Scheduler(object):
+    def __init__(self, policy='least_loaded', stats_ttl=1, smoothing=.2, default_duration=1.):
+        self.__policy = policies[policy]()
+        self.__stats_ttl = stats_ttl
+        self.__smoothing = smoothing
+        self.__default_duration = default_duration
+        self.__stats = {}  # key: [checked_at, queued, workers]
+        self.__durations = {}  # key: rolling average of job duration
+
+    @staticmethod
+    def key(destination, queue):
+        """ stats kept for each queue of destination. priority lanes of destination have separate queues.
+        """
+        return destination['host'], destination['port'], queue.name
+
+    def select(self, candidates):
+        """ choose one of (destination, queue) pairs. queued counter of chosen destination incremented locally.
+        """
+        if not candidates:
+            return None
+
+        if len(candidates) == 1:
+            dest, queue = candidates[0]
+        else:
+            now = monotonic()
+            for d, q in candidates:
+                self.__refresh(d, q, now)
+
+            dest, queue = self.__policy.select(candidates, self)
+
+        stats = self.__stats.get(self.key(dest, queue))
+        if stats is not None:
+            stats[1] += 1
+        return dest, queue
+
+    def observe(self, destination, queue, duration):
+        """ update rolling average job duration of destination queue.
+        """
+        key = self.key(destination, queue)
+        avg = self.__durations.get(key)
+        self.__durations[key] = duration if avg is None else avg + self.__smoothing * (duration - avg)
+
+    def duration(self, destination, queue):
+        return self.__durations.get(self.key(destination, queue), self.__default_duration)
+
+    def load(self, destination, queue):
+        """ expected time to finish all queued jobs on destination queue.
+        destinations without workers are always more loaded than others.
+        """
+        _, queued, workers = self.__stats.get(self.key(destination, queue), (0, 0, 1))
+        return not workers, (queued + 1) * self.duration(destination, queue) / (workers or 1)
+
+    def weight(self, destination, queue):
+        _, _, workers = self.__stats.get(self.key(destination, queue), (0, 0, 1))
+        return workers / self.duration(destination, queue)
+
+    def __refresh(self, destination, queue, now):
+        key = self.key(destination, queue)
+        stats = self.__stats.get(key)
+        if stats is not None and now - stats[0] < self.__stats_ttl:
+            return
+
+        try:
+            self.__stats[key] = [now, queue.count, Worker.count(queue=queue)]
+        except unavailable:
+            self.__stats[key] = [now, 0, 0]
+
+
+class FairShare(object):
+    """ per-user usage of modeling servers in sliding window. usage is count of sent structures.
+
+    usage of current window stored in MWUI_SHARE_<window number> hash. previous window counted proportionally
+    to its part overlapped by sliding window.
+    """
+    def __init__(self, connection, window=3600):
+        self.__connection = connection
+        self.__window = window
+
+    def charge(self, user, amount):
+        """ add amount to user usage. return usage of user and mean usage of active users.
+        """
+        now = time()
+        current = int(now // self.__window)
+        with self.__connection.pipeline(transaction=False) as pipe:
+            pipe.hincrbyfloat(self.__key(current), user, amount)
+            pipe.expire(self.__key(current), self.__window * 2)
+            pipe.hgetall(self.__key(current))
+            pipe.hgetall(self.__key(current - 1))
+            _, _, usage, previous = pipe.execute()
+
+        overlap = 1 - now % self.__window / self.__window
+        usage = {int(k): float(v) for k, v in usage.items()}
+        for k, v in previous.items():
+            k = int(k)
+            usage[k] = usage.get(k, 0) + float(v) * overlap
+
+        return usage[user], sum(usage.values()) / len(usage)
+
+    @staticmethod
+    def __key(window):
+        return 'MWUI_SHARE_%d' % window
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+import pickle
+import zlib
+from datetime import datetime
+from enum import Enum
+from msgpack import packb, unpackb, ExtType
+from ..constants import (StructureStatus, StructureType, TaskStatus, ModelType, TaskType, AdditiveType, ResultType,
+                         UserRole, JobPriority)
+
+
+VERSION = 1
+PLAIN = 0
+ZLIB = 1
+EXTERNAL = 15  # data kept outside of redis. header followed by reference
+
+PICKLED = 0
+TUPLE = 1
+DATETIME = 2
+# codes of enums are stored. never reorder. new enums appended.
+enums = (StructureStatus, StructureType, TaskStatus, ModelType, TaskType, AdditiveType, ResultType, UserRole,
+         JobPriority)
+enum_codes = {x: n for n, x in enumerate(enums, start=16)}
+code_enums = {n: x for x, n in enum_codes.items()}
+
+
+class Serializer(object):
+    """ compact replacement of pickle for task data stored in redis.
+
+    first byte is header: format version in high half and compression in low half.
+    data is msgpack with enums as integers. tuples and datetimes kept. other objects pickled.
+    data larger than threshold bytes compressed by zlib. threshold 0 disables compression.
+    pickled data of previous versions starts with protocol byte 0x80 and loaded as is.
+    """
+    def __init__(self, threshold=1024, level=1):
+        self.__threshold = threshold
+        self.__level = level
+
+    def dumps(self, obj):
+        data = packb(obj, default=self.__default, strict_types=True, use_bin_type=True)
+        if self.__threshold and len(data) > self.__threshold:
+            return bytes((VERSION << 4 | ZLIB,)) + zlib.compress(data, self.__level)
+        return bytes((VERSION << 4 | PLAIN,)) + data
+
+    def loads(self, data):
+        header = data[0]
+        if header >= 0x80:  # pickle
+            return pickle.loads(data)
+
+        version, compression = header >> 4, header & 15
+        if version != VERSION:
+            raise ValueError('unsupported serialization version: %d' % version)
+        if compression == EXTERNAL:
+            raise ValueError('reference to external data should be resolved before loading')
+
+        data = memoryview(data)[1:]
+        if compression == ZLIB:
+            data = zlib.decompress(data)
+        return self.__unpack(data)
+
+    def __default(self, obj):
+        if isinstance(obj, tuple):
+            return ExtType(TUPLE, packb(list(obj), default=self.__default, strict_types=True, use_bin_type=True))
+        if isinstance(obj, Enum):
+            code = enum_codes.get(type(obj))
+            if code is not None:
+                return ExtType(code, packb(obj.value))
+        elif isinstance(obj, datetime) and obj.tzinfo is None:
+            return ExtType(DATETIME, obj.isoformat().encode())
+        return ExtType(PICKLED, pickle.dumps(obj))
+
+    def __unpack(self, data):
+        return unpackb(data, ext_hook=self.__ext, raw=False, strict_map_key=False)
+
+    def __ext(self, code, data):
+        if code == TUPLE:
+            return tuple(self.__unpack(data))
+        if code == DATETIME:
+            return datetime.strptime(data.decode(), '%Y-%m-%dT%H:%M:%S.%f' if b'.' in data else '%Y-%m-%dT%H:%M:%S')
+        if code == PICKLED:
+            return pickle.loads(data)
+        return code_enums[code](unpackb(data))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+from collections import defaultdict
+from hashlib import sha1
+from msgpack import packb, unpackb
+from os import makedirs, replace, scandir, unlink, utime
+from os.path import join, dirname
+from struct import pack, unpack
+from threading import Lock
+from time import monotonic, time
+from uuid import uuid4
+from .serialization import VERSION, EXTERNAL
+
+
+MARK = bytes((VERSION << 4 | EXTERNAL,))
+
+
+class SpillStore(object):
+    """ task fields too large for redis kept in files.
+
+    fields of one task save larger than threshold bytes in sum packed into content-addressed file
+    <path>/<digest[:2]>/<digest>. redis fields keep references. modification time of file is its expiry time.
+    file starts with index of fields positions, so only requested fields are read.
+    every save of task moves expiry of all task files like redis ttl of task. expired files removed by sweep.
+    threshold 0 disables spilling.
+    """
+    def __init__(self, path, threshold=1048576, ttl=86400, sweep_interval=3600):
+        self.__path = path
+        self.__threshold = threshold
+        self.__ttl = ttl
+        self.__sweep_interval = sweep_interval
+        self.__swept_at = monotonic()
+        self.__lock = Lock()
+
+    def dump(self, fields):
+        """ spill dict of serialized fields if too large. return fields for redis and file digest or None.
+        """
+        if not self.__threshold or sum(len(x) for x in fields.values()) <= self.__threshold:
+            return fields, None
+
+        index, offset = {}, 0
+        for k, v in fields.items():
+            index[k] = (offset, len(v))
+            offset += len(v)
+        index = packb(index, use_bin_type=True)
+        blob = b''.join([pack('>I', len(index)), index] + list(fields.values()))
+        digest = sha1(blob).hexdigest()
+        file = self.__file(digest)
+        try:
+            utime(file, (time(), time() + self.__ttl))  # same content already stored
+        except FileNotFoundError:
+            makedirs(dirname(file), exist_ok=True)
+            tmp = '%s.%s' % (file, uuid4().hex)
+            with open(tmp, 'wb') as f:
+                f.write(blob)
+            utime(tmp, (time(), time() + self.__ttl))
+            replace(tmp, file)
+
+        reference = MARK + digest.encode()
+        return {k: reference for k in fields}, digest
+
+    def load(self, fields, files=None):
+        """ replace references in list of (name, redis value) pairs by data. return list of values.
+        values of lost files are None. files is dict of already loaded files indices for reuse between calls.
+        """
+        if files is None:
+            files = {}
+        out = []
+        references = defaultdict(list)
+        for n, (name, value) in enumerate(fields):
+            if value is not None and value[:1] == MARK:
+                references[value[1:].decode()].append((n, name))
+            out.append(value)
+
+        for digest, group in references.items():
+            try:
+                with open(self.__file(digest), 'rb') as f:
+                    index = files.get(digest)
+                    if index is None:
+                        size = unpack('>I', f.read(4))[0]
+                        index = files[digest] = (4 + size, unpackb(f.read(size), raw=False))
+                    start, positions = index
+                    for n, name in group:
+                        offset, size = positions[name]
+                        f.seek(start + offset)
+                        out[n] = f.read(size)
+            except FileNotFoundError:  # expired or removed
+                for n, _ in group:
+                    out[n] = None
+        return out
+
+    def touch(self, digests):
+        """ move expiry of task files. expired files removed not often than sweep interval.
+        """
+        expiry = time() + self.__ttl
+        for digest in digests:
+            try:
+                utime(self.__file(digest), (time(), expiry))
+            except FileNotFoundError:
+                pass
+
+        if monotonic() - self.__swept_at > self.__sweep_interval and self.__lock.acquire(blocking=False):
+            try:
+                self.__swept_at = monotonic()
+                self.__sweep()
+            finally:
+                self.__lock.release()
+
+    def __sweep(self):
+        now = time()
+        try:
+            groups = [x.path for x in scandir(self.__path) if x.is_dir()]
+        except FileNotFoundError:
+            return
+
+        for group in groups:
+            for x in scandir(group):
+                # temporary files of interrupted writes have creation time
+                expiry = now - self.__ttl if '.' in x.name else now
+                try:
+                    if x.stat().st_mtime < expiry:
+                        unlink(x.path)
+                except FileNotFoundError:
+                    pass
+
+    def __file(self, digest):
+        return join(self.__path, digest[:2], digest)
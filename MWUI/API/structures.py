@@ -99,11 +99,24 @@ class TaskStructureResponseFields:
 
 
 @swagger.model
-@swagger.nested(structures=TaskStructureResponseFields.__name__)
+class ModelProgressResponseFields:
+    resource_fields = dict(model=fields.Integer, done=fields.Integer, total=fields.Integer)
+
+
+@swagger.model
+@swagger.nested(models=ModelProgressResponseFields.__name__)
+class TaskProgressResponseFields:
+    resource_fields = dict(done=fields.Integer, total=fields.Integer, eta=fields.Integer,
+                           models=fields.List(fields.Nested(ModelProgressResponseFields.resource_fields)))
+
+
+@swagger.model
+@swagger.nested(structures=TaskStructureResponseFields.__name__, progress=TaskProgressResponseFields.__name__)
 class TaskGetResponseFields:
     resource_fields = dict(task=fields.String, date=fields.String, status=fields.Integer,
                            type=fields.Integer, user=fields.Integer,
-                           structures=fields.List(fields.Nested(TaskStructureResponseFields.resource_fields)))
+                           structures=fields.List(fields.Nested(TaskStructureResponseFields.resource_fields)),
+                           progress=fields.Nested(TaskProgressResponseFields.resource_fields))
 
 
 @swagger.model
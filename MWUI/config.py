@@ -58,8 +58,31 @@ REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_PASSWORD = None
 REDIS_TTL = 86400
-REDIS_JOB_TIMEOUT = 3600
+REDIS_JOB_TIMEOUT = 3600  # max job timeout. used for models without runtime history
+REDIS_JOB_MIN_TIMEOUT = 60
+REDIS_JOB_TIMEOUT_MARGIN = 3  # job timeout is estimated runtime of job multiplied by margin
 REDIS_MAIL = 'mail'
+REDIS_SCHEDULER = 'least_loaded'  # least_loaded, round_robin or two_choices
+REDIS_CHUNK_SIZE = 0  # max structures in one modeling job. 0 - all structures of model in one job
+REDIS_EVENTS = False  # workers publish finished jobs. redis_events.py should be deployed with workers
+REDIS_WAIT_TIMEOUT = 10  # long polling holds uWSGI thread. raise only with enough threads or async workers
+REDIS_CACHE_TTL = 86400 * 7
+REDIS_CACHE_SIZE = 100000  # max cached results per model. 0 - disable results cache
+REDIS_RETRY_ATTEMPTS = 3  # resend failed or lost jobs
+REDIS_RETRY_DELAY = 10  # seconds before first resend. doubled on each attempt
+REDIS_CONNECT_TIMEOUT = 2
+REDIS_SOCKET_TIMEOUT = 10  # max seconds of redis command. hung server fails request instead of blocking thread
+REDIS_COMPRESS_THRESHOLD = 1024  # tasks data larger than this bytes compressed. 0 - disable compression
+REDIS_SPILL_THRESHOLD = 1048576  # tasks data larger than this bytes saved in UPLOAD_PATH/tasks. 0 - disable
+REDIS_LANES = False  # separate queues for priorities. workers should listen <name>_admin <name> <name>_batch queues
+REDIS_INTERACTIVE_SIZE = 10  # max structures of interactive task. bigger tasks sent to batch queue
+REDIS_SHARE_WINDOW = 3600  # seconds of user usage accounting
+REDIS_SHARE_LIMIT = 1000  # structures in window after which user tasks sent to batch queue. 0 - unlimited
+REDIS_RATE_LIMIT = 30  # new tasks per minute for user. 0 - unlimited
+REDIS_RATE_BURST = 10
+REDIS_INFLIGHT_LIMIT = 10000  # unfinished structures of user. 0 - unlimited
+REDIS_BREAKER_THRESHOLD = 3  # connection failures in a row which mark server as dead
+REDIS_BREAKER_TIMEOUT = 10  # seconds between probes of dead server
 
 FP_SIZE = 12
 FP_ACTIVE_BITS = 2
@@ -78,6 +101,12 @@ DATA_STEREO = True
 config_list = ('UPLOAD_PATH', 'PORTAL_NON_ROOT', 'SECRET_KEY', 'RESIZE_URL', 'MAX_UPLOAD_SIZE', 'IMAGES_ROOT',
                'DB_USER', 'DB_PASS', 'DB_HOST', 'DB_NAME', 'DB_MAIN', 'DB_PRED', 'DB_DATA', 'YANDEX_METRIKA',
                'REDIS_HOST', 'REDIS_PORT', 'REDIS_PASSWORD', 'REDIS_TTL', 'REDIS_JOB_TIMEOUT', 'REDIS_MAIL',
+               'REDIS_SCHEDULER', 'REDIS_CHUNK_SIZE', 'REDIS_EVENTS', 'REDIS_WAIT_TIMEOUT',
+               'REDIS_CACHE_TTL', 'REDIS_CACHE_SIZE', 'REDIS_RETRY_ATTEMPTS', 'REDIS_RETRY_DELAY',
+               'REDIS_CONNECT_TIMEOUT', 'REDIS_SOCKET_TIMEOUT', 'REDIS_BREAKER_THRESHOLD', 'REDIS_BREAKER_TIMEOUT',
+               'REDIS_COMPRESS_THRESHOLD', 'REDIS_LANES', 'REDIS_INTERACTIVE_SIZE', 'REDIS_SHARE_WINDOW',
+               'REDIS_SHARE_LIMIT', 'REDIS_RATE_LIMIT', 'REDIS_RATE_BURST', 'REDIS_INFLIGHT_LIMIT',
+               'REDIS_JOB_MIN_TIMEOUT', 'REDIS_JOB_TIMEOUT_MARGIN', 'REDIS_SPILL_THRESHOLD',
                'LAB_NAME', 'LAB_SHORT', 'BLOG_POSTS_PER_PAGE', 'SCOPUS_API_KEY', 'SCOPUS_TTL',
                'SMPT_HOST', 'SMTP_PORT', 'SMTP_LOGIN', 'SMTP_PASSWORD', 'SMTP_MAIL', 'MAIL_INKEY', 'MAIL_SIGNER',
                'FP_SIZE', 'FP_ACTIVE_BITS', 'FRAGMENTOR_VERSION', 'DATA_ISOTOPE', 'DATA_STEREO',
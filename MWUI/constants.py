@@ -39,6 +39,7 @@ class TaskStatus(Enum):
     PREPARED = 2
     MODELING = 3
     DONE = 4
+    CANCELLED = 5
 
 
 class ModelType(Enum):
@@ -64,6 +65,12 @@ class TaskType(Enum):
     SUBSTRUCTURE = 2
 
 
+class JobPriority(Enum):
+    INTERACTIVE = 0
+    BATCH = 1
+    ADMIN = 2
+
+
 class AdditiveType(Enum):
     SOLVENT = 0
     CATALYST = 1
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+from enum import Enum
+from os import getpid
+from threading import Lock, Thread
+from time import monotonic, sleep
+from redis.exceptions import ConnectionError, TimeoutError
+from .config import REDIS_BREAKER_THRESHOLD, REDIS_BREAKER_TIMEOUT
+
+
+unavailable = (ConnectionError, TimeoutError)  # connect timeout isn't ConnectionError in redis-py
+
+
+class BreakerState(Enum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker(object):
+    """ health of one server.
+
+    closed: calls allowed. threshold consecutive failures open breaker.
+    open: calls rejected without network round trip. after timeout breaker becomes half-open.
+    half-open: only one trial call or background probe allowed. success closes breaker, failure opens it again.
+    """
+    def __init__(self, threshold=3, timeout=30, probe=None):
+        self.probe = probe
+        self.__threshold = threshold
+        self.__timeout = timeout
+        self.__lock = Lock()
+        self.__state = BreakerState.CLOSED
+        self.__failures = 0
+        self.__opened_at = 0
+
+    @property
+    def state(self):
+        return self.__state
+
+    def allow(self):
+        if self.__state == BreakerState.CLOSED:
+            return True
+        with self.__lock:
+            return self.__trial()
+
+    def due(self):
+        """ switch open breaker to half-open if timeout passed. used by background prober.
+        """
+        with self.__lock:
+            return self.__trial()
+
+    def success(self):
+        if self.__state == BreakerState.CLOSED and not self.__failures:
+            return
+        with self.__lock:
+            self.__state = BreakerState.CLOSED
+            self.__failures = 0
+
+    def failure(self):
+        """ return True if breaker opened.
+        """
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == BreakerState.HALF_OPEN or self.__failures >= self.__threshold:
+                opened = self.__state != BreakerState.OPEN
+                self.__state = BreakerState.OPEN
+                self.__opened_at = monotonic()
+                return opened
+            return False
+
+    def __trial(self):
+        if self.__state == BreakerState.CLOSED:
+            return True
+        if monotonic() - self.__opened_at >= self.__timeout:  # open or trial of half-open lost
+            self.__state = BreakerState.HALF_OPEN
+            self.__opened_at = monotonic()
+            return True
+        return False
+
+
+class HealthMonitor(object):
+    """ circuit breakers of servers shared by all request threads of process.
+
+    open breakers with probe are checked in background thread. requests don't wait for dead servers.
+    """
+    def __init__(self, threshold=3, timeout=30, interval=1):
+        self.__threshold = threshold
+        self.__timeout = timeout
+        self.__interval = interval
+        self.__breakers = {}
+        self.__lock = Lock()
+        self.__prober = None
+        self.__pid = None
+
+    def watch(self, key, connection):
+        """ register redis connection used for background probing of server.
+        """
+        self.__breaker(key).probe = connection.ping
+
+    def state(self, key):
+        return self.__breaker(key).state
+
+    def allow(self, key):
+        return self.__breaker(key).allow()
+
+    def success(self, key):
+        self.__breaker(key).success()
+
+    def failure(self, key):
+        if self.__breaker(key).failure():
+            self.__start()
+
+    def __breaker(self, key):
+        breaker = self.__breakers.get(key)
+        if breaker is None:
+            with self.__lock:
+                breaker = self.__breakers.setdefault(key, CircuitBreaker(self.__threshold, self.__timeout))
+        return breaker
+
+    def __start(self):
+        with self.__lock:
+            # threads don't survive uwsgi fork. check owner process.
+            if self.__prober is not None and self.__prober.is_alive() and self.__pid == getpid():
+                return
+            self.__pid = getpid()
+            self.__prober = Thread(target=self.__probe, name='MWUI health prober', daemon=True)
+            self.__prober.start()
+
+    def __probe(self):
+        while True:
+            sleep(self.__interval)
+            opened = False
+            for breaker in list(self.__breakers.values()):
+                if breaker.state == BreakerState.CLOSED:
+                    continue
+                opened = True
+                if breaker.probe is None or not breaker.due():
+                    continue
+                try:
+                    breaker.probe()
+                except unavailable:
+                    breaker.failure()
+                    continue
+                except Exception:  # server alive but e.g. password changed. requests will fail themselves.
+                    pass
+                breaker.success()
+
+            if not opened:
+                with self.__lock:
+                    if not any(x.state != BreakerState.CLOSED for x in self.__breakers.values()):
+                        self.__prober = None
+                        return
+
+
+health = HealthMonitor(threshold=REDIS_BREAKER_THRESHOLD, timeout=REDIS_BREAKER_TIMEOUT)
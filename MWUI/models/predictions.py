@@ -19,11 +19,58 @@
 #  MA 02110-1301, USA.
 #
 from datetime import datetime
+from io import StringIO
 from pony.orm import PrimaryKey, Required, Optional, Set
 from ..config import DEBUG
 from ..constants import TaskType, ResultType, StructureType, StructureStatus
 
 
+def allocate_ids(db, cursor, entity, count):
+    """ reserve count primary keys of entity table. should be called after any modification in transaction.
+    """
+    table = db.provider.quote_name(entity._table_)
+    if db.provider.dialect == 'PostgreSQL':
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", (table, count))
+        return [x for x, in cursor.fetchall()]
+
+    # sqlite holds write lock of database till commit
+    cursor.execute('SELECT max(id) FROM %s' % table)
+    start = (cursor.fetchone()[0] or 0) + 1
+    return list(range(start, start + count))
+
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def insert_rows(db, cursor, entity, attrs, rows, max_params=999):
+    """ bulk insert of rows into entity table. COPY for postgres, multirow INSERTs for other databases.
+    """
+    if not rows:
+        return
+    provider = db.provider
+    table = provider.quote_name(entity._table_)
+    columns = ', '.join(provider.quote_name(getattr(entity, x).column) for x in attrs)
+
+    if provider.dialect == 'PostgreSQL':
+        data = StringIO()
+        for row in rows:
+            data.write('\t'.join(copy_value(x) for x in row))
+            data.write('\n')
+        data.seek(0)
+        cursor.copy_expert('COPY %s (%s) FROM STDIN' % (table, columns), data)
+        return
+
+    placeholder = '(%s)' % ', '.join(['?' if provider.paramstyle == 'qmark' else '%s'] * len(attrs))
+    size = max(1, max_params // len(attrs))
+    for n in range(0, len(rows), size):
+        chunk = rows[n: n + size]
+        cursor.execute('INSERT INTO %s (%s) VALUES %s' % (table, columns, ', '.join([placeholder] * len(chunk))),
+                       [x for row in chunk for x in row])
+
+
 def load_tables(db, schema):
     class Task(db.Entity):
         _table_ = '%s_task' % schema if DEBUG else (schema, 'task')
@@ -41,6 +88,80 @@ def load_tables(db, schema):
         def type(self):
             return TaskType(self.task_type)
 
+        @staticmethod
+        def bulk_create(user, date, _type, structures):
+            """ save task with structures, additives and results in few queries. return task.
+            should be called in db_session.
+            """
+            task = Task(type=_type, date=date, user=user)
+            task.flush()
+
+            cursor = db.get_connection().cursor()
+            ids = allocate_ids(db, cursor, Structure, len(structures))
+            _structures, additives, results = [], [], []
+            for i, s in zip(ids, structures):
+                # strings stripped like in pony attributes
+                _structures.append((i, s['data'].strip(), s['type'].value, s['status'].value, s['temperature'],
+                                    s['pressure'], task.id))
+                additives.extend((a['additive'], i, a['amount']) for a in s['additives'])
+                results.extend((m['model'], i, r['type'].value, r['key'].strip(), r['value'].strip())
+                               for m in s['models'] for r in m.get('results', []))
+
+            insert_rows(db, cursor, Structure, ('id', 'structure', 'structure_type', 'structure_status',
+                                                'temperature', 'pressure', 'task'), _structures)
+            insert_rows(db, cursor, Additiveset, ('additive', 'structure', 'amount'), additives)
+            insert_rows(db, cursor, Result, ('model', 'structure', 'result_type', 'key', 'value'), results)
+            return task
+
+        def get_structures(self, after=0, limit=None, offset=0):
+            """ structures of task ordered by id with additives and results lists. loaded by one query.
+
+            after is id of last structure of previous page. limit and offset for page.
+            results is list of (model, key, value, result_type). additives is list of (additive, amount).
+            """
+            q = db.provider.quote_name
+            n = dict(structure=q(Structure._table_), result=q(Result._table_), additives=q(Additiveset._table_))
+            for e, attrs in ((Structure, ('id', 'structure', 'structure_type', 'structure_status', 'temperature',
+                                          'pressure', 'task')),
+                             (Result, ('model', 'key', 'value', 'result_type', 'structure', 'id')),
+                             (Additiveset, ('additive', 'amount', 'structure', 'id'))):
+                n.update(('%s_%s' % (e.__name__, x), q(getattr(e, x).column)) for x in attrs)
+
+            page = ('SELECT {Structure_id}, {Structure_structure}, {Structure_structure_type}, '
+                    '{Structure_structure_status}, {Structure_temperature}, {Structure_pressure} FROM {structure} '
+                    'WHERE {Structure_task} = $task AND {Structure_id} > $after ORDER BY {Structure_id}')
+            if limit:
+                page += ' LIMIT $limit'
+                if offset:
+                    page += ' OFFSET $offset'
+
+            # results and additives of page structures in one union. structure data only in results part
+            sql = ('SELECT p.{Structure_id}, p.{Structure_structure}, p.{Structure_structure_type}, '
+                   'p.{Structure_structure_status}, p.{Structure_temperature}, p.{Structure_pressure}, '
+                   'r.{Result_model}, r.{Result_key}, r.{Result_value}, r.{Result_result_type}, NULL, NULL, '
+                   'r.{Result_id} FROM (%s) p LEFT JOIN {result} r ON r.{Result_structure} = p.{Structure_id} '
+                   'UNION ALL '
+                   'SELECT a.{Additiveset_structure}, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, NULL, '
+                   'a.{Additiveset_additive}, a.{Additiveset_amount}, a.{Additiveset_id} '
+                   'FROM (%s) p JOIN {additives} a ON a.{Additiveset_structure} = p.{Structure_id} '
+                   'ORDER BY 1, 13') % (page, page)
+
+            structures, additives = {}, {}
+            for row in db.select(sql.format(**n), dict(task=self.id, after=after, limit=limit, offset=offset)):
+                if row[1] is None:
+                    additives.setdefault(row[0], []).append(tuple(row[10:12]))
+                    continue
+                x = structures.get(row[0])
+                if x is None:
+                    x = structures[row[0]] = dict(structure=row[0], data=row[1], type=row[2], status=row[3],
+                                                  temperature=row[4], pressure=row[5], additives=[], results=[])
+                if row[6] is not None:
+                    x['results'].append(tuple(row[6:10]))
+
+            for k, v in additives.items():
+                structures[k]['additives'] = v
+            return list(structures.values())
+
     class Structure(db.Entity):
         _table_ = '%s_structure' % schema if DEBUG else (schema, 'structure')
         id = PrimaryKey(int, auto=True)
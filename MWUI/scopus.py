@@ -19,12 +19,16 @@
 #  MA 02110-1301, USA.
 #
 from requests import get
-from redis import Redis, ConnectionError
+from redis import Redis
 from collections import MutableSet
-from .config import SCOPUS_API_KEY, REDIS_HOST, REDIS_PASSWORD, REDIS_PORT, SCOPUS_TTL
+from .config import (SCOPUS_API_KEY, REDIS_HOST, REDIS_PASSWORD, REDIS_PORT, SCOPUS_TTL, REDIS_CONNECT_TIMEOUT,
+                     REDIS_SOCKET_TIMEOUT)
+from .health import health, unavailable
 
 
-cache = Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
+cache = Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+              socket_timeout=REDIS_SOCKET_TIMEOUT)
+health.watch((REDIS_HOST, REDIS_PORT), cache)
 
 
 class OrderedSet(MutableSet):
@@ -89,12 +93,16 @@ def get_articles(author_id):
     if not SCOPUS_API_KEY:
         return None
 
+    if not health.allow((REDIS_HOST, REDIS_PORT)):
+        return None
+
     try:
-        cache.ping()
-    except ConnectionError:
+        result = cache.get('SCOPUS_%s' % author_id)
+    except unavailable:
+        health.failure((REDIS_HOST, REDIS_PORT))
         return None
 
-    result = cache.get('SCOPUS_%s' % author_id)
+    health.success((REDIS_HOST, REDIS_PORT))
     if not result:
         metrics = get("https://api.elsevier.com/content/author/author_id/%s?view=METRICS" % author_id,
                       headers={'Accept': 'application/json', 'X-ELS-APIKey': SCOPUS_API_KEY})
@@ -128,7 +136,10 @@ def get_articles(author_id):
             arts.append('* **{date}:** *{title}* / {authors} // ***{journal}.*** V.{volume}. Is.{issue}. P.{pages} '
                         '[cited count: {cited}, [doi](//dx.doi.org/{doi})]'.format(**reformatted))
         result = '\n'.join(arts)
-        cache.set('SCOPUS_%s' % author_id, result.encode(), ex=SCOPUS_TTL)
+        try:
+            cache.set('SCOPUS_%s' % author_id, result.encode(), ex=SCOPUS_TTL)
+        except unavailable:
+            health.failure((REDIS_HOST, REDIS_PORT))
     else:
         result = result.decode()
     return result
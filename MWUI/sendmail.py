@@ -18,7 +18,7 @@
 #  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
 #  MA 02110-1301, USA.
 #
-from redis import Redis, ConnectionError
+from redis import Redis
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.header import Header
@@ -29,7 +29,14 @@ from flask import render_template
 from misaka import HTML_ESCAPE
 from .bootstrap import CustomMisakaRenderer
 from .config import (LAB_NAME, SMTP_MAIL, REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_MAIL, DEBUG,
-                     MAIL_INKEY, MAIL_SIGNER)
+                     MAIL_INKEY, MAIL_SIGNER, REDIS_CONNECT_TIMEOUT, REDIS_SOCKET_TIMEOUT)
+from .health import health, unavailable
+
+
+sender = Queue(connection=Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD,
+                                socket_connect_timeout=REDIS_CONNECT_TIMEOUT, socket_timeout=REDIS_SOCKET_TIMEOUT),
+                 name=REDIS_MAIL, default_timeout=3600)
+health.watch((REDIS_HOST, REDIS_PORT), sender.connection)
 
 
 def send_mail(message, to_mail, to_name=None, from_name=None, subject=None, banner=None, title=None,
@@ -38,14 +45,8 @@ def send_mail(message, to_mail, to_name=None, from_name=None, subject=None, bann
     if reply_name and not reply_mail:
         reply_name = None
 
-    r = Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
-
-    try:
-        r.ping()
-        sender = Queue(connection=r, name=REDIS_MAIL, default_timeout=3600)
-    except ConnectionError:
-        if not DEBUG:
-            return False
+    if not health.allow((REDIS_HOST, REDIS_PORT)) and not DEBUG:
+        return False
 
     out = ['Subject: %s' % Header(subject).encode() or 'No Title',
            'To: %s' % ('%s <%s>' % (Header(to_name).encode(), to_mail) if to_name else to_mail),
@@ -70,8 +71,12 @@ def send_mail(message, to_mail, to_name=None, from_name=None, subject=None, bann
         out.append(msg.as_string())
 
     try:
-        return sender.enqueue_call('redis_mail.run', args=(to_mail, '\n'.join(out)), result_ttl=60).id
-    except:
+        job = sender.enqueue_call('redis_mail.run', args=(to_mail, '\n'.join(out)), result_ttl=60).id
+        health.success((REDIS_HOST, REDIS_PORT))
+        return job
+    except Exception as err:
+        if isinstance(err, unavailable):
+            health.failure((REDIS_HOST, REDIS_PORT))
         if not DEBUG:
             return False
         print('\n'.join(out))
@@ -9,7 +9,8 @@
             models: BASE_URL + 'api/resources/models',
             upload: BASE_URL + 'api/task/upload/0',
             resultTemplate: BASE_URL + 'static/js/predictor/result.htm',
-            saveTask: BASE_URL + 'api/task/results/'
+            saveTask: BASE_URL + 'api/task/results/',
+            wait: BASE_URL + 'api/task/wait/'
         },
 
         /* Delay between requests */
@@ -17,7 +18,8 @@
         request = {
             timeOut: 400,
             increament: 400,
-            count: 6
+            count: 6,
+            waitCount: 10
         },
 
         /* Pages and buttons is show and hide */
@@ -62,6 +64,51 @@
             }
             $page.errorMessage.find(".text").html(text);
             $page.errorMessage.fadeIn(300).delay(10000).fadeOut(800);
+        },
+
+        /* Catalogs kept in localStorage and revalidated by ETag. Promise resolved with data */
+
+        $catalog = function (url) {
+            var cached = null;
+            try {
+                cached = JSON.parse(localStorage.getItem(url));
+            } catch (e) {
+            }
+            return $.ajax(url, {
+                type: 'GET',
+                headers: cached ? {'If-None-Match': cached.etag} : {}
+            }).then(function (data, textStatus, jqXHR) {
+                if (jqXHR.status == 304 && cached) {
+                    return cached.data;
+                }
+                var etag = jqXHR.getResponseHeader('ETag');
+                if (etag) {
+                    try {
+                        localStorage.setItem(url, JSON.stringify({etag: etag, data: data}));
+                    } catch (e) {
+                    }
+                }
+                return data;
+            });
+        },
+
+        /* Long polling. Callback called when task ready or waiting failed.
+           Used only if server receives events of workers, otherwise callback called at once */
+
+        $wait = function (id, callback, count) {
+            if (window.WAIT_EVENTS !== true) {
+                callback();
+                return;
+            }
+            $.get(API.wait + id).done(function () {
+                callback();
+            }).fail(function (jqXHR) {
+                if (jqXHR.status == 512 && count > 0) {
+                    $wait(id, callback, count - 1);
+                } else {
+                    callback();
+                }
+            });
         };
 
     /* main page object */
@@ -173,13 +220,15 @@
                 $page.modelPage.html('').show();
 
                 $.when(
-                    $.ajax(API.models, {type: 'GET'}),
-                    $.ajax(API.additives, {type: 'GET'})
+                    $catalog(API.models),
+                    $catalog(API.additives)
                 ).done(function ($models, $additives) {
 
-                    models = $models[0];
-                    additives = $additives[0];
-                    func(request.timeOut, request.increament, request.count);
+                    models = $models;
+                    additives = $additives;
+                    $wait(id, function () {
+                        func(request.timeOut, request.increament, request.count);
+                    }, request.waitCount);
                 }).fail(function (jqXHR, textStatus, errorThrown) {
                     $messange('Models (Additives): ' + jqXHR.status + "-" + errorThrown, 'error');
                 });
@@ -340,7 +389,13 @@
                 }
 
 
-                func(request.timeOut, request.increament, request.count);
+                if (typePage == 'result') {
+                    $wait(id, function () {
+                        func(request.timeOut, request.increament, request.count);
+                    }, request.waitCount);
+                } else {
+                    func(request.timeOut, request.increament, request.count);
+                }
             },
 
             onRevalidating: function () {
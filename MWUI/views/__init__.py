@@ -26,6 +26,7 @@ from pycountry import countries
 from ..forms import DeleteButtonForm
 from ..models import User, Meeting, Post, Attachment, Subscription
 from ..constants import UserRole, MeetingPostType, ProfileStatus
+from ..config import REDIS_EVENTS
 from .auth import LoginView, LogoutView
 from .profile import ProfileView
 from .post import PostView
@@ -102,7 +103,7 @@ def results():
 @view_bp.route('/predictor', methods=['GET'])
 @login_required
 def predictor():
-    return render_template("predictor.html", title='Predictor', subtitle='UI')
+    return render_template("predictor.html", title='Predictor', subtitle='UI', events=REDIS_EVENTS)
 
 
 @view_bp.route('/<string:_slug>/')
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+""" poll latency of RedisCombiner.fetch_job versus number of unfinished sub-jobs.
+
+compares pipelined bulk fetch with one by one Queue.fetch_job calls on the same queue.
+rq workers on benchmark queue should not be started. usage:
+
+    python benchmarks/fetch_job.py --host localhost --sizes 1 10 100 1000
+"""
+import sys
+from argparse import ArgumentParser
+from os.path import dirname, abspath
+from time import perf_counter
+from statistics import median
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from redis import Redis
+from rq import Queue
+from MWUI.API.redis import RedisCombiner
+from MWUI.constants import TaskStatus, TaskType, StructureStatus, StructureType, ModelType
+
+
+def structures(n, model):
+    return [dict(structure=x, data='C', status=StructureStatus.CLEAR, type=StructureType.MOLECULE, pressure=1,
+                 temperature=298, additives=[], models=[model.copy()]) for x in range(1, n + 1)]
+
+
+def timeit(f, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return median(times) * 1000
+
+
+def main():
+    parser = ArgumentParser(description='fetch_job poll latency benchmark')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--password', default=None)
+    parser.add_argument('--queue', default='benchmark_fetch_job')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    destination = dict(host=args.host, port=args.port, password=args.password, name=args.queue)
+    model = dict(model=0, name='benchmark', type=ModelType.MOLECULE_MODELING, destinations=[destination])
+    combiner = RedisCombiner(host=args.host, port=args.port, password=args.password, chunk_size=1)
+    queue = Queue(connection=Redis(host=args.host, port=args.port, password=args.password), name=args.queue)
+
+    print('%10s %15s %15s' % ('sub-jobs', 'bulk, ms', 'one by one, ms'))
+    for n in args.sizes:
+        queue.empty()
+        task = combiner.new_job(dict(status=TaskStatus.MODELING, type=TaskType.MODELING, user=0,
+                                     structures=structures(n, model)))
+        if task is None:
+            print('task creation failed')
+            return
+
+        ids = queue.job_ids
+        bulk = timeit(lambda: combiner.fetch_job(task['id']), args.repeat)
+        single = timeit(lambda: [queue.fetch_job(x).is_finished for x in ids], args.repeat)
+        print('%10d %15.2f %15.2f' % (n, bulk, single))
+
+    queue.empty()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+""" end-to-end load test of task pipeline: create -> prepare -> model -> save results.
+
+local redis-server and rq workers with stand-in modeling (benchmarks/redis_worker.py) started on free port.
+API driven by flask test client from concurrent clients. database is temporary sqlite file.
+redis-server binary and MWUI requirements should be installed. usage:
+
+    python benchmarks/pipeline.py --clients 8 --tasks 100 --structures 10 --workers 4 --latency .01
+"""
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
+from os import environ, pathsep
+from os.path import dirname, abspath, join
+from shutil import rmtree
+from socket import socket
+from subprocess import Popen, DEVNULL
+from tempfile import mkdtemp
+from threading import Lock, local
+from time import perf_counter, sleep
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+
+from redis import Redis
+from MWUI.constants import ModelType, TaskType
+
+
+def free_port():
+    with socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+
+def start_redis(port, workdir):
+    server = Popen(['redis-server', '--port', str(port), '--bind', '127.0.0.1', '--save', '', '--appendonly', 'no',
+                    '--dir', workdir], stdout=DEVNULL)
+    connection = Redis(port=port)
+    for _ in range(100):
+        try:
+            connection.ping()
+            return server
+        except Exception:
+            sleep(.1)
+    server.terminate()
+    raise RuntimeError('redis-server not started')
+
+
+def start_workers(args, port, queues):
+    env = dict(environ, PYTHONPATH=pathsep.join((join(root, 'benchmarks'), root)),
+               MWUI_BENCH_LATENCY=str(args.latency), MWUI_BENCH_OVERHEAD=str(args.overhead),
+               MWUI_BENCH_JITTER=str(args.jitter))
+    return [Popen([sys.executable, '-m', 'rq.cli', 'worker', '-q', '-u', 'redis://localhost:%d' % port] + queues,
+                  env=env, stdout=DEVNULL) for _ in range(args.workers)]
+
+
+def setup(args, port, workdir):
+    """ configure MWUI for local redis and sqlite database. return flask app with API only and model id.
+    """
+    from MWUI import config
+    config.DEBUG = True  # sqlite tables naming
+    config.DB_MAIN, config.DB_PRED, config.DB_DATA_LIST = 'main', 'pred', []
+    config.REDIS_HOST, config.REDIS_PORT, config.REDIS_PASSWORD = 'localhost', port, None
+    config.REDIS_EVENTS = False
+    config.REDIS_CHUNK_SIZE = args.chunk
+    config.REDIS_SCHEDULER = args.scheduler
+    config.REDIS_RATE_LIMIT = args.rate
+    config.REDIS_INFLIGHT_LIMIT = 0
+
+    from flask import Flask
+    from flask_login import LoginManager
+    from pony.orm import db_session
+    from MWUI.models import db, User, Model, Destination
+    from MWUI.logins import load_user
+    from MWUI.API import api_bp
+
+    db.bind('sqlite', join(workdir, 'database.sqlite'), create_db=True)
+    db.generate_mapping(create_tables=True)
+    with db_session:
+        User(email='bench@localhost', password='bench', name='bench', surname='bench', country='RUS')
+        for name, _type in (('bench_prepare', ModelType.PREPARER), ('bench_model', ModelType.MOLECULE_MODELING)):
+            m = Model(type=_type, name=name)
+            Destination(model=m, host='localhost', port=port, name=name)
+        m.flush()
+
+    app = Flask('MWUI')
+    app.config['SECRET_KEY'] = 'benchmark'
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.user_loader(load_user)
+    app.register_blueprint(api_bp, url_prefix='/api')
+    return app, m.id
+
+
+class Stats(object):
+    def __init__(self):
+        self.__lock = Lock()
+        self.latency = defaultdict(list)
+        self.codes = defaultdict(lambda: defaultdict(int))
+
+    def add(self, name, latency, code=200):
+        with self.__lock:
+            self.latency[name].append(latency)
+            self.codes[name][code] += 1
+
+
+def percentile(values, p):
+    return values[max(0, ceil(p / 100 * len(values)) - 1)]
+
+
+class Client(object):
+    """ API user. each thread has own test client with login session.
+    """
+    def __init__(self, app, args, stats):
+        self.__app = app
+        self.__args = args
+        self.__stats = stats
+        self.__local = local()
+
+    @property
+    def __client(self):
+        client = getattr(self.__local, 'client', None)
+        if client is None:
+            client = self.__local.client = self.__app.test_client()
+            client.post('/api/auth', json=dict(user='bench@localhost', password='bench'))
+        return client
+
+    def __request(self, name, method, url, **kwargs):
+        while True:
+            start = perf_counter()
+            response = getattr(self.__client, method)(url, **kwargs)
+            self.__stats.add(name, perf_counter() - start, response.status_code)
+            if response.status_code != 429:
+                return response
+            sleep(int(response.headers.get('Retry-After', 1)))
+
+    def __wait(self, name, url):
+        while True:
+            response = self.__request(name, 'get', url)
+            if response.status_code != 512:
+                return response
+            sleep(self.__args.poll)
+
+    def session(self, n):
+        """ full pipeline of one task. return True on success.
+        """
+        start = perf_counter()
+        structures = [dict(data='C' * (x % 10 + 1)) for x in range(self.__args.structures)]
+        response = self.__request('create', 'post', '/api/task/create/%d' % TaskType.MODELING.value, json=structures)
+        if response.status_code != 201:
+            return False
+
+        response = self.__wait('prepare', '/api/task/prepare/%s' % response.get_json()['task'])
+        if response.status_code != 200:
+            return False
+
+        prepared = response.get_json()
+        models = [dict(structure=s['structure'], models=[dict(model=self.__args.model)])
+                  for s in prepared['structures']]
+        response = self.__request('model', 'post', '/api/task/model/%s' % prepared['task'], json=models)
+        if response.status_code != 201:
+            return False
+
+        task = response.get_json()['task']
+        response = self.__wait('results', '/api/task/model/%s' % task)
+        if response.status_code != 200:
+            return False
+
+        response = self.__request('save', 'post', '/api/task/results/%s' % task)
+        if response.status_code != 201:
+            return False
+
+        self.__stats.add('pipeline', perf_counter() - start)
+        return True
+
+
+def main():
+    parser = ArgumentParser(description='task pipeline load test')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent API clients')
+    parser.add_argument('--tasks', type=int, default=20, help='total tasks')
+    parser.add_argument('--structures', type=int, default=10, help='structures in task')
+    parser.add_argument('--workers', type=int, default=2, help='rq workers')
+    parser.add_argument('--latency', type=float, default=.01, help='worker seconds per structure')
+    parser.add_argument('--overhead', type=float, default=.05, help='worker seconds per job')
+    parser.add_argument('--jitter', type=float, default=.2, help='relative deviation of worker latency')
+    parser.add_argument('--poll', type=float, default=.1, help='seconds between polls of unfinished task')
+    parser.add_argument('--chunk', type=int, default=0, help='REDIS_CHUNK_SIZE')
+    parser.add_argument('--scheduler', default='least_loaded', help='REDIS_SCHEDULER')
+    parser.add_argument('--rate', type=int, default=0, help='REDIS_RATE_LIMIT')
+    args = parser.parse_args()
+
+    workdir = mkdtemp(prefix='mwui_bench_')
+    port = free_port()
+    server = start_redis(port, workdir)
+    workers = []
+    try:
+        app, args.model = setup(args, port, workdir)
+        workers = start_workers(args, port, ['bench_prepare', 'bench_model'])
+
+        stats = Stats()
+        client = Client(app, args, stats)
+        start = perf_counter()
+        with ThreadPoolExecutor(args.clients) as executor:
+            done = sum(executor.map(client.session, range(args.tasks)))
+        elapsed = perf_counter() - start
+    finally:
+        for w in workers:
+            w.terminate()
+        server.terminate()
+        for p in workers + [server]:
+            p.wait()
+        rmtree(workdir)
+
+    requests = sum(len(x) for k, x in stats.latency.items() if k != 'pipeline')
+    print('tasks %d of %d done in %.2f s: %.2f tasks/s, %.1f structures/s, %.1f requests/s' %
+          (done, args.tasks, elapsed, done / elapsed, done * args.structures / elapsed, requests / elapsed))
+    print('%10s %8s %10s %10s %10s  %s' % ('stage', 'requests', 'p50, ms', 'p95, ms', 'p99, ms', 'codes'))
+    for name in ('create', 'prepare', 'model', 'results', 'save', 'pipeline'):
+        values = sorted(stats.latency.get(name, ()))
+        if values:
+            print('%10s %8d %10.1f %10.1f %10.1f  %s' % (name, len(values), percentile(values, 50) * 1000,
+                                                         percentile(values, 95) * 1000, percentile(values, 99) * 1000,
+                                                         dict(stats.codes[name]) if name != 'pipeline' else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+""" stand-in of modeling servers worker for benchmarks/pipeline.py. sleeps instead of modeling.
+
+latency set by environment: MWUI_BENCH_OVERHEAD seconds per job, MWUI_BENCH_LATENCY seconds per structure,
+MWUI_BENCH_JITTER relative random deviation of sleep time.
+"""
+from os import environ
+from random import uniform
+from time import sleep
+from MWUI.constants import StructureStatus, StructureType, ModelType, ResultType
+
+
+def run(structures, model):
+    overhead = float(environ.get('MWUI_BENCH_OVERHEAD', 0))
+    latency = float(environ.get('MWUI_BENCH_LATENCY', 0))
+    jitter = float(environ.get('MWUI_BENCH_JITTER', 0))
+    sleep((overhead + latency * len(structures)) * uniform(1 - jitter, 1 + jitter))
+
+    for s in structures:
+        if model['type'] == ModelType.PREPARER:
+            s['status'] = StructureStatus.CLEAR
+            s['type'] = StructureType.MOLECULE
+            results = [dict(type=ResultType.TEXT, key='check', value='structure is valid')]
+        else:
+            results = [dict(type=ResultType.TEXT, key='prediction', value='%.3f' % uniform(0, 1))]
+        s['models'] = [dict(model, results=results)]
+    return structures
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+""" saving of modeled task into predictions tables: entity per row vs Task.bulk_create.
+
+database is temporary sqlite file or empty postgres database given by --host. tables created with DEBUG names
+and dropped after run. MWUI requirements should be installed. usage:
+
+    python benchmarks/save.py --structures 5000 --models 3 --results 3
+    python benchmarks/save.py --host localhost --user mwui --password mwui --database bench
+"""
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from os.path import dirname, abspath, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+
+root = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, root)
+
+from MWUI import config
+config.DEBUG = True  # tables without schemas
+config.DB_MAIN, config.DB_PRED, config.DB_DATA_LIST = 'main', 'pred', []
+
+from pony.orm import db_session, flush
+from MWUI.constants import ModelType, TaskType, StructureType, StructureStatus, ResultType, AdditiveType
+from MWUI.models import db, User, Model, Additive, Task, Structure, Result, Additiveset
+
+
+def make_task(args, models, additives):
+    return [dict(data='C' * (x % 20 + 1), type=StructureType.MOLECULE, status=StructureStatus.CLEAR,
+                 temperature=298., pressure=1., additives=[dict(additive=a, amount=1.) for a in additives],
+                 models=[dict(model=m, results=[dict(type=ResultType.TEXT, key='key %d' % k, value='%.5f' % (x / 7))
+                                                for k in range(args.results)]) for m in models])
+            for x in range(args.structures)]
+
+
+def save_entities(user, structures):
+    """ old way: entity per row.
+    """
+    with db_session:
+        _task = Task(type=TaskType.MODELING, date=datetime.utcnow(), user=User[user])
+        for s in structures:
+            _structure = Structure(structure=s['data'], type=s['type'], temperature=s['temperature'],
+                                   pressure=s['pressure'], status=s['status'], task=_task)
+            for a in s['additives']:
+                Additiveset(additive=Additive[a['additive']], structure=_structure, amount=a['amount'])
+
+            for m in s['models']:
+                for r in m.get('results', []):
+                    Result(model=m['model'], structure=_structure, type=r['type'], key=r['key'], value=r['value'])
+
+
+def save_bulk(user, structures):
+    with db_session:
+        Task.bulk_create(User[user], datetime.utcnow(), TaskType.MODELING, structures)
+
+
+def main():
+    parser = ArgumentParser(description='modeled task saving benchmark')
+    parser.add_argument('--structures', type=int, default=5000, help='structures in task')
+    parser.add_argument('--models', type=int, default=3, help='models of structure')
+    parser.add_argument('--results', type=int, default=3, help='results of model')
+    parser.add_argument('--additives', type=int, default=1, help='additives of structure')
+    parser.add_argument('--repeat', type=int, default=3, help='saves of task by each way')
+    parser.add_argument('--host', help='postgres host. sqlite used if not set')
+    parser.add_argument('--user', help='postgres user')
+    parser.add_argument('--password', help='postgres password')
+    parser.add_argument('--database', help='postgres database')
+    args = parser.parse_args()
+
+    workdir = mkdtemp(prefix='mwui_bench_')
+    if args.host:
+        db.bind('postgres', user=args.user, password=args.password, host=args.host, database=args.database)
+    else:
+        db.bind('sqlite', join(workdir, 'database.sqlite'), create_db=True)
+    db.generate_mapping(create_tables=True)
+    try:
+        with db_session:
+            user = User(email='bench@localhost', password='bench', name='bench', surname='bench', country='RUS')
+            models = [Model(type=ModelType.MOLECULE_MODELING, name='bench %d' % x) for x in range(args.models)]
+            additives = [Additive(type=AdditiveType.SOLVENT, name='bench %d' % x) for x in range(args.additives)]
+            flush()
+            user, models, additives = user.id, [x.id for x in models], [x.id for x in additives]
+
+        structures = make_task(args, models, additives)
+        rows = args.structures * (1 + args.additives + args.models * args.results)
+        print('task of %d structures: %d rows' % (args.structures, rows))
+        times = {}
+        for name, save in (('entities', save_entities), ('bulk', save_bulk)):
+            for _ in range(args.repeat):
+                start = perf_counter()
+                save(user, structures)
+                times.setdefault(name, []).append(perf_counter() - start)
+            best = min(times[name])
+            print('%10s: best %8.3f s, %10.0f rows/s' % (name, best, rows / best))
+        print('speedup %.1f' % (min(times['entities']) / min(times['bulk'])))
+    finally:
+        db.drop_all_tables(with_all_data=True)
+        db.disconnect()
+        rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+""" encode/decode time and size of task data stored in redis: pickle versus compact serializer.
+
+structures carry marvin documents and modeling results like real modeling tasks. redis server not required.
+usage:
+
+    python benchmarks/serialization.py --sizes 1 10 100 1000 --atoms 30
+"""
+import pickle
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from os.path import dirname, abspath
+from random import choice, random, seed
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from MWUI.API.serialization import Serializer
+from MWUI.constants import TaskStatus, TaskType, StructureStatus, StructureType, ModelType, ResultType
+
+
+def marvin(atoms):
+    """ marvin document with given number of atoms and chain bonds.
+    """
+    elements = ' '.join(choice('CCCCNOS') for _ in range(atoms))
+    ids = ' '.join('a%d' % x for x in range(1, atoms + 1))
+    x2 = ' '.join('%.4f' % (random() * 10) for _ in range(atoms))
+    y2 = ' '.join('%.4f' % (random() * 10) for _ in range(atoms))
+    bonds = ''.join('<bond id="b%d" atomRefs2="a%d a%d" order="%d"/>' % (x, x, x + 1, choice((1, 1, 2)))
+                    for x in range(1, atoms))
+    return ('<cml xmlns="http://www.chemaxon.com" version="ChemAxon file format v17.1.2"><MDocument><MChemicalStruct>'
+            '<molecule molID="m1"><atomArray atomID="%s" elementType="%s" x2="%s" y2="%s"/><bondArray>%s</bondArray>'
+            '</molecule></MChemicalStruct></MDocument></cml>' % (ids, elements, x2, y2, bonds))
+
+
+def structures(n, atoms):
+    model = dict(model=1, name='benchmark', type=ModelType.MOLECULE_MODELING, destinations=[
+        dict(host='localhost', port=6379, password=None, name='benchmark')])
+    return [dict(structure=x, data=marvin(atoms), status=StructureStatus.CLEAR, type=StructureType.MOLECULE,
+                 pressure=1, temperature=298, additives=[dict(additive=1, amount=.5, name='water', structure='O',
+                                                             type=0)],
+                 models=[dict(model, results=[dict(type=ResultType.TEXT, key='prediction', value='%.3f' % random()),
+                                              dict(type=ResultType.TEXT, key='domain', value='True')])])
+            for x in range(1, n + 1)]
+
+
+def timeit(f, repeat):
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return median(times) * 1000
+
+
+def main():
+    parser = ArgumentParser(description='task serialization benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--atoms', type=int, default=30)
+    parser.add_argument('--threshold', type=int, default=1024)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    seed(0)
+    coders = [('pickle', pickle), ('msgpack', Serializer(0)), ('msgpack+zlib', Serializer(args.threshold))]
+    print('%10s %15s %12s %12s %12s' % ('structures', 'format', 'size, KB', 'encode, ms', 'decode, ms'))
+    for n in args.sizes:
+        # task stored as hash of meta and structures fields. blob of all fields measured.
+        data = structures(n, args.atoms)
+        meta = (dict(status=TaskStatus.DONE, type=TaskType.MODELING, user=1, index=list(range(1, n + 1)),
+                     jobs=[], cache={}, retries={}), datetime.utcnow())
+
+        for name, coder in coders:
+            encoded = [coder.dumps(meta)] + [coder.dumps(s) for s in data]
+            size = sum(len(x) for x in encoded) / 1024
+            encode = timeit(lambda: [coder.dumps(meta)] + [coder.dumps(s) for s in data], args.repeat)
+            decode = timeit(lambda: [coder.loads(x) for x in encoded], args.repeat)
+            print('%10d %15s %12.1f %12.2f %12.2f' % (n, name, size, encode, decode))
+
+
+if __name__ == '__main__':
+    main()
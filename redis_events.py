@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  Copyright 2017 Ramil Nugmanov <stsouko@live.ru>
+#  This file is part of MWUI.
+#
+#  MWUI is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU Affero General Public License as published by
+#  the Free Software Foundation; either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Affero General Public License for more details.
+#
+#  You should have received a copy of the GNU Affero General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+from redis import Redis
+from MWUI.config import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD
+
+
+events = Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD)
+
+
+def run(job, connection, *args, **kwargs):
+    """ rq success and failure callback. notify MWUI about finished modeling job.
+    """
+    task = job.meta.get('task')
+    if task:
+        events.publish('MWUI_TASK_%s' % task, job.id)